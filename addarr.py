@@ -1,48 +1,181 @@
 #!/usr/bin/env python3
-from flask import Flask, request
-import threading
-import logging
-import re
-import os
-import math
-
-import json
-import yaml
-from telegram import ReplyKeyboardMarkup, ReplyKeyboardRemove
-from telegram.ext import (
-    Updater,
-    CommandHandler,
-    ConversationHandler,
-    MessageHandler,
-    Filters,
-)
+import startup
+
+with startup.phase("import standard library"):
+    import collections
+    import threading
+    import logging
+    import re
+    import secrets
+    import signal
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    import functools
+
+with startup.phase("import python-telegram-bot"):
+    from telegram import (
+        Update,
+        InlineKeyboardButton,
+        InlineKeyboardMarkup,
+        InlineQueryResultArticle,
+        InputTextMessageContent,
+        ReplyKeyboardMarkup,
+        ReplyKeyboardRemove,
+    )
+    from telegram.error import BadRequest, RetryAfter
+    from telegram.utils.request import Request
+    from telegram.ext.utils.promise import Promise
+    from telegram.ext import (
+        ExtBot,
+        Updater,
+        CallbackQueryHandler,
+        CommandHandler,
+        ConversationHandler,
+        InlineQueryHandler,
+        MessageHandler,
+        TypeHandler,
+        Filters,
+    )
 
-from definitions import CONFIG_PATH, LANG_PATH, CHATID_PATH, ADMIN_PATH, REQUESTS_PATH
-import radarr as radarr
-import sonarr as sonarr
-import logger
-import requests
+with startup.phase("load config"):
+    import settings
+    from settings import config, transcript
+
+with startup.phase("import addarr modules"):
+    import authorization
+    import bulk
+    import cache
+    import chatstate
+    import commons
+    import radarr as radarr
+    import sonarr as sonarr
+    import store
+    import logger
+    import metrics
 
 __version__ = "0.3"
 
-config = yaml.safe_load(open(CONFIG_PATH, encoding="utf8"))
-
 # Set up logging
 logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
 logger = logger.getLogger("addarr", logLevel, config.get("logToConsole", False))
 logger.debug(f"Addarr v{__version__} starting up...")
 
-SERIE_MOVIE_AUTHENTICATED, READ_CHOICE, GIVE_OPTION, GIVE_PATHS, GIVE_PROFILES, TSL_NORMAL, CHOOSE_SERIE, CHOOSE_SEASON = range(8)
+SERIE_MOVIE_AUTHENTICATED, READ_CHOICE, GIVE_OPTION, GIVE_PATHS, GIVE_PROFILES, TSL_NORMAL, CHOOSE_SERIE, CHOOSE_SEASON, BULK_LIST = range(9)
+
+# Blocking handlers can run on the dispatcher's worker pool instead of inline
+concurrency = config.get("concurrency", {})
+runAsync = concurrency.get("enable", False)
+
+
+class TimedRequest(Request):
+    """Bot API connection that records the latency of every call."""
 
-updater = Updater(config["telegram"]["token"], use_context=True)
+    def post(self, url, data, timeout=None):
+        with metrics.telegramSeconds.time(url.rsplit("/", 1)[-1]):
+            return super().post(url, data, timeout=timeout)
+
+
+with startup.phase("create updater"):
+    workers = concurrency.get("workers", 4)
+    updater = Updater(
+        bot=ExtBot(
+            config["telegram"]["token"], request=TimedRequest(con_pool_size=workers + 4)
+        ),
+        workers=workers,
+        use_context=True,
+    )
 dispatcher = updater.dispatcher
-lang = config["language"]
 
-transcript = yaml.safe_load(open(LANG_PATH, encoding="utf8"))
-transcript = transcript[lang]
+# Verifies that webhook updates come from Telegram, a new one every start
+# unless it's configured
+secretToken = str(
+    config["telegram"].get("webhook", {}).get("secretToken") or secrets.token_urlsafe(32)
+)
+
+# Max length of a Telegram message
+TELEGRAM_MAX_LENGTH = 4096
+
+# Rendered /allSeries pages by library snapshot, for the page buttons
+allSeriesPages = cache.TTLCache(3600, maxsize=16)
+metrics.registerCache("all_series_pages", allSeriesPages)
+
+queueExecutor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="queue")
+
+# Inline queries come in on every keystroke: a query is only searched once
+# the user stopped typing for `debounce` seconds, and a newer query of the
+# same user replaces the one that is still waiting
+inlineSettings = config.get("inline", {})
+inlineDebounce = inlineSettings.get("debounce", 0.4)
+inlineMinLength = inlineSettings.get("minLength", 3)
+pendingInline = {}
+pendingInlineLock = threading.Lock()
+inlineExecutor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="inline")
 
 
 def main():
+    with startup.phase("register handlers"):
+        registerHandlers()
+
+    notifications = config.get("notifications", {}).get("enable", True)
+    telegramWebhook = config["telegram"].get("webhook", {})
+    serveWebhook = notifications or telegramWebhook.get("enable", False)
+    if serveWebhook:
+        with startup.phase("import webhook server"):
+            import webhook
+    if startup.enabled:
+        # Only time what starting up costs, without opening the database,
+        # listening on the port, watching the config or polling Sonarr/Radarr
+        with startup.phase("load library snapshots"):
+            sonarr.librarySnapshot.load()
+            radarr.librarySnapshot.load()
+        print(startup.report())
+        return
+
+    with startup.phase("open database"):
+        store.init()
+    if serveWebhook:
+        with startup.phase("start webhook server"):
+            if telegramWebhook.get("enable", False):
+                webhook.attachTelegram(
+                    updater, telegramWebhook.get("path", "/telegram"), secretToken
+                )
+            webhook.start(notifications)
+
+    settings.watch()
+    with startup.phase("load library snapshots"):
+        sonarr.librarySnapshot.start()
+        radarr.librarySnapshot.start()
+
+    logger.debug("Startup timings:\n" + startup.report())
+
+    logger.info(transcript["Start chatting"])
+    if telegramWebhook.get("enable", False):
+        runWebhook(telegramWebhook)
+    else:
+        updater.start_polling()
+        updater.idle()
+
+
+# Telegram pushes the updates to the webhook server, so there is no polling
+# thread: start the dispatcher and job queue and register the URL instead
+def runWebhook(telegramWebhook):
+    updater.job_queue.start()
+    threading.Thread(target=dispatcher.start, name="dispatcher", daemon=True).start()
+    updater.bot.set_webhook(
+        url=telegramWebhook["url"].rstrip("/") + telegramWebhook.get("path", "/telegram"),
+        max_connections=telegramWebhook.get("maxConnections", 40),
+        secret_token=secretToken,
+    )
+
+    stopped = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda signum, frame: stopped.set())
+    while not stopped.wait(1):
+        pass
+    updater.stop()
+
+
+def registerHandlers():
     auth_handler_command = CommandHandler(config["entrypointAuth"], authentication)
     auth_handler_text = MessageHandler(
                             Filters.regex(
@@ -50,12 +183,14 @@ def main():
                             ),
                             authentication,
                         )
-    allSeries_handler_command = CommandHandler(config["entrypointAllSeries"], allSeries)
+    allSeries_handler_command = CommandHandler(
+        config["entrypointAllSeries"], perChat(allSeries)
+    )
     allSeries_handler_text = MessageHandler(
                             Filters.regex(
                                 re.compile(r"" + config["entrypointAllSeries"] + "", re.IGNORECASE)
                             ),
-                            allSeries,
+                            perChat(allSeries),
                         )
     addMovieserie_handler = ConversationHandler(
         entry_points=[
@@ -70,11 +205,15 @@ def main():
             ),
         ],
         states={
-            SERIE_MOVIE_AUTHENTICATED: [MessageHandler(Filters.text, choiceSerieMovie)],
+            SERIE_MOVIE_AUTHENTICATED: [
+                MessageHandler(
+                    Filters.text, perChat(choiceSerieMovie)
+                )
+            ],
             READ_CHOICE: [
                 MessageHandler(
                     Filters.regex(f'^({transcript["Movie"]}|{transcript["Serie"]})$'),
-                    searchSerieMovie,
+                    perChat(searchSerieMovie),
                 )
             ],
             GIVE_OPTION: [
@@ -95,7 +234,7 @@ def main():
             GIVE_PROFILES: [
                 MessageHandler(
                     Filters.regex(re.compile(r"^(.*)$", re.IGNORECASE)),
-                    addSerieMovie,
+                    perChat(addSerieMovie),
                 ),
             ],
         },
@@ -103,20 +242,26 @@ def main():
             CommandHandler("stop", stop),
             MessageHandler(Filters.regex("^(Stop|stop)$"), stop),
         ],
+        conversation_timeout=chatstate.idleTimeout,
     )
 
     download_season_handler = ConversationHandler(
         entry_points=[
-            CommandHandler(config["season"], chooseSerie)
+            CommandHandler(config["season"], perChat(chooseSerie))
         ],
         states={
-            CHOOSE_SERIE: [MessageHandler(Filters.text, chooseSeason)],
+            CHOOSE_SERIE: [
+                MessageHandler(
+                    Filters.text & ~Filters.regex("^(Stop|stop)$"), chooseSeason
+                )
+            ],
             CHOOSE_SEASON: [MessageHandler(Filters.text, searchSeason)],
         },
         fallbacks=[
             CommandHandler("stop", stop),
             MessageHandler(Filters.regex("^(Stop|stop)$"), stop),
         ],
+        conversation_timeout=chatstate.idleTimeout,
     )
 
     changeTransmissionSpeed_handler = ConversationHandler(
@@ -136,59 +281,140 @@ def main():
             CommandHandler("stop", stop),
             MessageHandler(Filters.regex("^(Stop|stop)$"), stop),
         ],
+        conversation_timeout=chatstate.idleTimeout,
+    )
+    pourcentage_handler_command = CommandHandler(
+        config["entrypointPourcentage"], perChat(pourcentage)
+    )
+    refresh_handler_command = CommandHandler(config.get("entrypointRefresh", "refresh"), refresh)
+    bulk_handler = ConversationHandler(
+        entry_points=[CommandHandler(config.get("entrypointBulk", "bulk"), bulkAdd)],
+        states={
+            BULK_LIST: [
+                MessageHandler(
+                    Filters.document.file_extension("txt")
+                    | Filters.document.file_extension("csv")
+                    | (Filters.text & ~Filters.command & ~Filters.regex("^(Stop|stop)$")),
+                    bulkList,
+                )
+            ],
+        },
+        fallbacks=[
+            CommandHandler("stop", stop),
+            MessageHandler(Filters.regex("^(Stop|stop)$"), stop),
+        ],
+        conversation_timeout=chatstate.idleTimeout,
+    )
+    transmissionStatus_handler_command = CommandHandler(
+        config.get("entrypointTransmissionStatus", "speed"),
+        transmissionStatus,
+        run_async=runAsync,
+    )
+
+    memory_handler_command = CommandHandler(
+        config.get("entrypointMemory", "memory"), memory
     )
-    pourcentage_handler_command = CommandHandler(config["entrypointPourcentage"], pourcentage)
 
+    # Runs before the other handlers, for the idle expiry of chat state
+    dispatcher.add_handler(TypeHandler(Update, chatstate.touch), group=-1)
     dispatcher.add_handler(auth_handler_command)
     dispatcher.add_handler(auth_handler_text)
     dispatcher.add_handler(allSeries_handler_command)
     dispatcher.add_handler(allSeries_handler_text)
+    dispatcher.add_handler(CallbackQueryHandler(allSeriesPage, pattern=r"^allSeries:"))
     dispatcher.add_handler(addMovieserie_handler)
     dispatcher.add_handler(changeTransmissionSpeed_handler)
+    dispatcher.add_handler(transmissionStatus_handler_command)
     dispatcher.add_handler(pourcentage_handler_command)
     dispatcher.add_handler(download_season_handler)
+    dispatcher.add_handler(bulk_handler)
+    dispatcher.add_handler(refresh_handler_command)
+    dispatcher.add_handler(memory_handler_command)
+    if inlineSettings.get("enable", True):
+        dispatcher.add_handler(InlineQueryHandler(inlineQuery))
+    updater.job_queue.run_repeating(
+        lambda context: chatstate.sweep(dispatcher),
+        chatstate.sweepInterval,
+    )
 
-    logger.info(transcript["Start chatting"])
-    updater.start_polling()
-    updater.idle()
+    conversationHandlers.extend(
+        [
+            addMovieserie_handler,
+            download_season_handler,
+            changeTransmissionSpeed_handler,
+            bulk_handler,
+        ]
+    )
+
+
+# Conversation handlers, for the active conversation count on /metrics
+conversationHandlers = []
+metrics.gauge(
+    "addarr_active_conversations",
+    "Conversations that are waiting for the next answer of a user.",
+    lambda: sum(len(handler.conversations) for handler in conversationHandlers),
+)
+
+
+# Updates of a chat waiting for the one before them, by chat id. A chat is
+# only in here while a task is running its updates
+chatQueues = {}
+chatQueuesLock = threading.Lock()
+
+
+# Handle the updates of one chat one at a time and in order. On the worker
+# pool every chat gets a queue that one task at a time works through, so
+# the updates waiting for their chat don't hold a worker thread
+def perChat(callback):
+    @functools.wraps(callback)
+    def wrapper(update, context):
+        if not runAsync:
+            return callback(update, context)
+        chatId = update.effective_chat.id if update.effective_chat else None
+        # A ConversationHandler takes the new state from the promise once
+        # it's done, like with run_async
+        promise = Promise(callback, (update, context), {}, update=update)
+        with chatQueuesLock:
+            idle = chatId not in chatQueues
+            chatQueues.setdefault(chatId, collections.deque()).append(promise)
+        if idle:
+            dispatcher.run_async(runChatQueue, chatId)
+        return promise
+
+    return wrapper
+
+
+# Run the next update of the chat, then queue a task for the one after it
+# so other chats get their turn on the pool in between
+def runChatQueue(chatId):
+    with chatQueuesLock:
+        promise = chatQueues[chatId].popleft()
+    promise.run()
+    if promise.exception is not None:
+        logger.error(
+            f"Handling an update of chat {chatId} failed: {promise.exception}",
+            exc_info=promise.exception,
+        )
+    with chatQueuesLock:
+        more = bool(chatQueues[chatId])
+        if not more:
+            del chatQueues[chatId]
+    if more:
+        dispatcher.run_async(runChatQueue, chatId)
 
 
 # Check if Id is authenticated
 def checkId(update):
-    authorize = False
-    with open(CHATID_PATH, "r") as file:
-        firstChar = file.read(1)
-        if not firstChar:
-            return False
-        file.close()
-    with open(CHATID_PATH, "r") as file:
-        for line in file:
-            if line.strip("\n") == str(update.effective_message.chat_id):
-                authorize = True
-        file.close()
-        if authorize:
-            return True
-        else:
-            return False
+    return update.effective_message.chat_id in authorization.chatIds
 
 
 # Check if user is an admin
 def checkAdmin(update):
-    admin = False
     user = update.message.from_user
-    with open(ADMIN_PATH, "r") as file:
-        for line in file:
-            if line.strip("\n") == str(user["username"]) or line.strip("\n") == str(
-                user["id"]
-            ):
-                admin = True
-        file.close()
-        if admin:
-            return True
-        else:
-            return False
+    return user["username"] in authorization.admins or user["id"] in authorization.admins
 
 
+@metrics.timed
 def transmission(
     update, context,
 ):
@@ -225,6 +451,7 @@ def transmission(
         return ConversationHandler.END
 
 
+@metrics.timed
 def changeSpeedTransmission(update, context):
     if not checkId(update):
         if (
@@ -232,82 +459,92 @@ def changeSpeedTransmission(update, context):
         ):  # To also stop the beginning command
             return ConversationHandler.END
     else:
+        import transmission
+
         choice = update.message.text
         if choice == transcript["Transmission"]["TSL"]:
-            if config["transmission"]["authentication"]:
-                auth = (
-                    " --auth "
-                    + config["transmission"]["username"]
-                    + ":"
-                    + config["transmission"]["password"]
-                )
-            os.system(
-                "transmission-remote "
-                + config["transmission"]["host"]
-                + auth
-                + " --alt-speed"
-            )
+            if transmission.setAltSpeed(True):
+                text = transcript["Transmission"]["ChangedToTSL"]
+            else:
+                text = transcript["Transmission"]["Failed"]
             context.bot.send_message(
-                chat_id=update.effective_message.chat_id,
-                text=transcript["Transmission"]["ChangedToTSL"],
+                chat_id=update.effective_message.chat_id, text=text,
             )
             return ConversationHandler.END
 
         elif choice == transcript["Transmission"]["Normal"]:
-            if config["transmission"]["authentication"]:
-                auth = (
-                    " --auth "
-                    + config["transmission"]["username"]
-                    + ":"
-                    + config["transmission"]["password"]
-                )
-            os.system(
-                "transmission-remote "
-                + config["transmission"]["host"]
-                + auth
-                + " --no-alt-speed"
-            )
+            if transmission.setAltSpeed(False):
+                text = transcript["Transmission"]["ChangedToNormal"]
+            else:
+                text = transcript["Transmission"]["Failed"]
             context.bot.send_message(
-                chat_id=update.effective_message.chat_id,
-                text=transcript["Transmission"]["ChangedToNormal"],
+                chat_id=update.effective_message.chat_id, text=text,
             )
             return ConversationHandler.END
 
 
+@metrics.timed
+def transmissionStatus(update, context):
+    if not config["transmission"]["enable"]:
+        text = transcript["Transmission"]["NotEnabled"]
+    elif not checkId(update):
+        text = transcript["Authorize"]
+    elif not checkAdmin(update):
+        text = transcript["NotAdmin"]
+    else:
+        import transmission
+
+        status = transmission.getStatus()
+        if status is None:
+            text = transcript["Transmission"]["Failed"]
+        else:
+            download, upload, altSpeed = status
+            text = (
+                f"⬇️ {formatSpeed(download)}\n⬆️ {formatSpeed(upload)}\n"
+                + transcript["Transmission"]["ChangedToTSL" if altSpeed else "ChangedToNormal"]
+            )
+    context.bot.send_message(chat_id=update.effective_message.chat_id, text=text)
+
+
+def formatSpeed(bytesPerSecond):
+    speed = float(bytesPerSecond)
+    for unit in ("B/s", "KB/s", "MB/s"):
+        if speed < 1024:
+            return f"{speed:.1f} {unit}"
+        speed /= 1024
+    return f"{speed:.1f} GB/s"
+
+
+@metrics.timed
 def authentication(update, context):
     chatid = update.effective_message.chat_id
-    with open(CHATID_PATH, "r") as file:
-        if(str(chatid) in file.read()):
+    if chatid in authorization.chatIds:
+        context.bot.send_message(
+            chat_id=update.effective_message.chat_id,
+            text=transcript["Chatid already allowed"],
+        )
+    else:
+        password = update.message.text
+        if("/auth" in password):
+            password = password.replace("/auth ", "")
+        if password == config["telegram"]["password"]:
+            authorization.chatIds.add(chatid)
             context.bot.send_message(
                 chat_id=update.effective_message.chat_id,
-                text=transcript["Chatid already allowed"],
-            )                
-            file.close()
+                text=transcript["Chatid added"],
+            )
+            return "added"
         else:
-            file.close()
-            password = update.message.text
-            if("/auth" in password):
-                password = password.replace("/auth ", "")
-            if password == config["telegram"]["password"]:
-                with open(CHATID_PATH, "a") as file:
-                    file.write(str(chatid) + "\n")
-                    context.bot.send_message(
-                        chat_id=update.effective_message.chat_id,
-                        text=transcript["Chatid added"],
-                    )
-                    file.close()
-                    return "added"
-            else:
-                logger.warning(
-                    f"Failed authentication attempt by [{update.message.from_user.username}]. Password entered: [{password}]"
-                )
-                context.bot.send_message(
-                    chat_id=update.effective_message.chat_id, text=transcript["Wrong password"]
-                )
-                return ConversationHandler.END # This only stops the auth conv, so it goes back to choosing screen
-            
+            logger.warning(
+                f"Failed authentication attempt by [{update.message.from_user.username}]. Password entered: [{password}]"
+            )
+            context.bot.send_message(
+                chat_id=update.effective_message.chat_id, text=transcript["Wrong password"]
+            )
+            return ConversationHandler.END # This only stops the auth conv, so it goes back to choosing screen
 
 
+@metrics.timed
 def stop(update, context):
     clearUserData(context)
     context.bot.send_message(
@@ -317,6 +554,7 @@ def stop(update, context):
     return ConversationHandler.END
 
 
+@metrics.timed
 def startSerieMovie(update, context):
     if checkId(update):
         if update.message.text[1:].lower() in [
@@ -347,6 +585,7 @@ def startSerieMovie(update, context):
         return SERIE_MOVIE_AUTHENTICATED
 
 
+@metrics.timed
 def choiceSerieMovie(update, context):
     if not checkId(update):
         if (
@@ -375,6 +614,7 @@ def choiceSerieMovie(update, context):
             return READ_CHOICE
 
 
+@metrics.timed
 def searchSerieMovie(update, context):
     title = context.user_data["title"]
     if context.user_data.get("title"):
@@ -392,7 +632,9 @@ def searchSerieMovie(update, context):
 
     searchResult = service.search(title)
     if searchResult:
-        context.user_data["output"] = service.giveTitles(searchResult)
+        context.user_data["output"] = chatstate.compactResults(
+            service.giveTitles(searchResult)
+        )
 
         reply_keyboard = [
             [transcript[choice.lower()]["Add"], transcript["Next result"]],
@@ -403,11 +645,12 @@ def searchSerieMovie(update, context):
             chat_id=update.effective_message.chat_id,
             text=transcript[choice.lower()]["This"],
         )
-        context.bot.sendPhoto(
-            chat_id=update.effective_message.chat_id,
-            photo=context.user_data["output"][position]["poster"],
+        sendPoster(
+            context,
+            update.effective_message.chat_id,
+            context.user_data["output"][position].poster,
         )
-        text = f"{context.user_data['output'][position]['title']} ({context.user_data['output'][position]['year']})"
+        text = f"{context.user_data['output'][position].title} ({context.user_data['output'][position].year})"
         context.bot.send_message(
             chat_id=update.effective_message.chat_id, text=text, reply_markup=markup
         )
@@ -420,6 +663,7 @@ def searchSerieMovie(update, context):
         return ConversationHandler.END
 
 
+@metrics.timed
 def nextOption(update, context):
     markup = None
     position = context.user_data["position"] + 1
@@ -438,14 +682,15 @@ def nextOption(update, context):
             chat_id=update.effective_message.chat_id,
             text=transcript[choice.lower()]["This"],
         )
-        context.bot.sendPhoto(
-            chat_id=update.effective_message.chat_id,
-            photo=context.user_data["output"][position]["poster"],
+        sendPoster(
+            context,
+            update.effective_message.chat_id,
+            context.user_data["output"][position].poster,
         )
         text = (
-            context.user_data["output"][position]["title"]
+            context.user_data["output"][position].title
             + " ("
-            + str(context.user_data["output"][position]["year"])
+            + str(context.user_data["output"][position].year)
             + ")"
         )
         context.bot.send_message(
@@ -462,6 +707,7 @@ def nextOption(update, context):
         return ConversationHandler.END
 
 
+@metrics.timed
 def pathSerieMovie(update, context):
     oddItem = None
     service = getService(context)
@@ -491,6 +737,7 @@ def pathSerieMovie(update, context):
     return GIVE_PATHS
 
 
+@metrics.timed
 def languageSerieMovie(update, context):
     oddItem = None
     if not context.user_data.get("path"):
@@ -509,7 +756,9 @@ def languageSerieMovie(update, context):
 
     service = getService(context)
     profiles = service.getProfiles()
-    context.user_data.update({"profiles": profiles})
+    context.user_data.update(
+        {"profiles": tuple((profile["id"], profile["name"]) for profile in profiles)}
+    )
     formattedProfiles = [f"{profile['name']}" for profile in profiles]
 
     if len(profiles) % 2 > 0:
@@ -529,17 +778,18 @@ def languageSerieMovie(update, context):
     return GIVE_PROFILES
 
 
+@metrics.timed
 def addSerieMovie(update, context):
     position = context.user_data["position"]
     choice = context.user_data["choice"]
-    idnumber = context.user_data["output"][position]["id"]
+    idnumber = context.user_data["output"][position].id
     path = context.user_data["path"]
 
     if not context.user_data.get("profile"):
         # Path selection should be in the update message
-        for profile in context.user_data.get("profiles"):
-            if profile["name"] == update.message.text:
-                context.user_data["profile"] = profile["id"]
+        for profileId, name in context.user_data.get("profiles"):
+            if name == update.message.text:
+                context.user_data["profile"] = profileId
                 break
     if not context.user_data.get("profile"):
         logger.debug(
@@ -556,11 +806,7 @@ def addSerieMovie(update, context):
                 chat_id=update.effective_message.chat_id,
                 text=transcript[choice.lower()]["Success"],
             )
-            with open(REQUESTS_PATH, "r") as json_file:
-                requests_json = json.load(json_file)
-                requests_json[idnumber] = update.message.chat.id
-            with open(REQUESTS_PATH, "w") as json_file:
-                json.dump(requests_json, json_file)
+            store.userRequests.add(idnumber, update.message.chat.id)
             clearUserData(context)
             return ConversationHandler.END
         else:
@@ -579,6 +825,131 @@ def addSerieMovie(update, context):
         return ConversationHandler.END
 
 
+@metrics.timed
+def bulkAdd(update, context):
+    if not checkId(update):
+        context.bot.send_message(
+            chat_id=update.effective_message.chat_id, text=transcript["Authorize"]
+        )
+        return ConversationHandler.END
+
+    # "/bulk movie" on the first line, the titles can follow on the next ones
+    command, _, text = update.message.text.partition("\n")
+    args = command.split()[1:]
+    choice = args[0].lower() if args else ""
+    if choice == transcript["Serie"].lower():
+        context.user_data["choice"] = transcript["Serie"]
+    elif choice == transcript["Movie"].lower():
+        context.user_data["choice"] = transcript["Movie"]
+    else:
+        context.bot.send_message(
+            chat_id=update.effective_message.chat_id, text=transcript["Bulk"]["Usage"]
+        )
+        return ConversationHandler.END
+
+    if text.strip():
+        return startBulk(update, context, text)
+    context.bot.send_message(
+        chat_id=update.effective_message.chat_id, text=transcript["Bulk"]["Send list"]
+    )
+    return BULK_LIST
+
+
+@metrics.timed
+def bulkList(update, context):
+    document = update.message.document
+    if document is None:
+        return startBulk(update, context, update.message.text)
+    if (document.file_size or 0) > config.get("bulk", {}).get("maxFileSize", 1024 * 1024):
+        context.bot.send_message(
+            chat_id=update.effective_message.chat_id, text=transcript["Bulk"]["Too large"]
+        )
+        clearUserData(context)
+        return ConversationHandler.END
+    content = document.get_file().download_as_bytearray()
+    isCsv = (document.file_name or "").lower().endswith(".csv")
+    return startBulk(
+        update, context, content.decode("utf-8-sig", errors="replace"), isCsv
+    )
+
+
+def startBulk(update, context, text, isCsv=False):
+    chat_id = update.effective_message.chat_id
+    choice = context.user_data["choice"]
+    service = getService(context)
+    clearUserData(context)
+
+    titles, leftOut = bulk.parseTitles(text, isCsv)
+    if not titles:
+        context.bot.send_message(chat_id=chat_id, text=transcript["Bulk"]["Usage"])
+        return ConversationHandler.END
+    try:
+        path, profile = bulkDefaults(service)
+    except Exception as e:
+        logger.error(f"Can't get the root folders and profiles for a bulk add: {e}")
+        context.bot.send_message(chat_id=chat_id, text=transcript[choice.lower()]["Failed"])
+        return ConversationHandler.END
+
+    started = transcript["Bulk"]["Started"]
+    if leftOut:
+        started += f'\n{transcript["Bulk"]["Left out"]}: {leftOut}'
+    context.bot.send_message(chat_id=chat_id, text=started)
+    # Adding hundreds of titles takes a while, don't hold up the dispatcher
+    threading.Thread(
+        target=runBulk,
+        args=(context.bot, chat_id, choice, service, titles, path, profile),
+        name="bulk",
+        daemon=True,
+    ).start()
+    return ConversationHandler.END
+
+
+# The root folder and quality profile set in the bulk config for the
+# service, otherwise the first of each
+def bulkDefaults(service):
+    defaults = config.get("bulk", {}).get(service.__name__, {})
+    path = defaults.get("path") or service.getRootFolders()[0]["path"]
+    profiles = service.getProfiles()
+    profile = next(
+        (item["id"] for item in profiles if item["name"] == defaults.get("profile")),
+        profiles[0]["id"],
+    )
+    return path, profile
+
+
+def runBulk(bot, chat_id, choice, service, titles, path, profile):
+    try:
+        results = bulk.addAll(service, titles, path, profile)
+        byOutcome = {}
+        for title, outcome, mediaId in results:
+            byOutcome.setdefault(outcome, []).append(title)
+            if outcome == bulk.ADDED:
+                store.userRequests.add(mediaId, chat_id)
+
+        entries = [
+            f'{transcript["Bulk"][label]}: {len(byOutcome.get(outcome, []))}'
+            for label, outcome in [
+                ("Added", bulk.ADDED),
+                ("Skipped", bulk.SKIPPED),
+                ("Not found", bulk.NOT_FOUND),
+                ("Failed", bulk.FAILED),
+            ]
+        ]
+        for label, outcome in [("Not found", bulk.NOT_FOUND), ("Failed", bulk.FAILED)]:
+            if byOutcome.get(outcome):
+                entries.append(f'\n{transcript["Bulk"][label]}:')
+                entries.extend(f"- {title}" for title in byOutcome[outcome])
+        for page in commons.paginate(entries, TELEGRAM_MAX_LENGTH):
+            bot.send_message(chat_id=chat_id, text=page)
+    except Exception as e:
+        logger.error(f"Bulk add in chat {chat_id} failed: {e}")
+        try:
+            bot.send_message(chat_id=chat_id, text=transcript[choice.lower()]["Failed"])
+        except Exception as e:
+            logger.error(f"Can't tell chat {chat_id} the bulk add failed: {e}")
+
+
+@metrics.timed
 def allSeries(update, context):
     if not checkId(update):
         if (
@@ -586,64 +957,68 @@ def allSeries(update, context):
         ):  # To also stop the beginning command
             return ConversationHandler.END
     else:
-        result = sonarr.allSeries()
-        string = ""
-        for serie in result:
-            string += "• " \
-            + serie["title"] \
-            + " (" \
-            + str(serie["year"]) \
-            + ")" \
-            + "\n" \
-            + "        status: " \
-            + serie["status"] \
-            + "\n" \
-            + "        monitored: " \
-            + str(serie["monitored"]).lower() \
-            + "\n"
-        
-        #max length of a message is 4096 chars
-        if len(string) <= 4096:
+        version, result = sonarr.librarySnapshot.view()
+        token = f"v{version}"
+        pages = allSeriesPages.get(token)
+        if pages is None:
+            entries = [
+                f"• {serie['title']} ({serie['year']})\n"
+                f"        status: {serie['status']}\n"
+                f"        monitored: {str(serie['monitored']).lower()}"
+                for serie in result
+            ]
+            pages = commons.paginate(entries, TELEGRAM_MAX_LENGTH)
+            allSeriesPages.set(token, pages)
+        if not pages:
+            return ConversationHandler.END
+
+        if config.get("paginateAllSeries", True):
             context.bot.send_message(
                 chat_id=update.effective_message.chat_id,
-                text=string,
+                text=pages[0],
+                reply_markup=allSeriesKeyboard(token, 0, len(pages)),
             )
-        #split string if longer then 4096 chars
-        else: 
-            neededSplits = math.ceil(len(string) / 4096)
-            positionNewLine = []
-            index = 0
-            while index < len(string): #Get positions of newline, so that the split will happen after a newline
-                i = string.find("\n", index)
-                if i == -1:
-                    return positionNewLine
-                positionNewLine.append(i)
-                index+=1
-
-            #split string at newline closest to maxlength
-            stringParts = []
-            lastSplit = timesSplit = 0
-            i = 4096
-            while i > 0 and len(string)>4096: 
-                if timesSplit < neededSplits:
-                    if i+lastSplit in positionNewLine:
-                        stringParts.append(string[0:i])
-                        string = string[i+1:]
-                        timesSplit+=1
-                        lastSplit = i
-                        i = 4096
-                i-=1
-            stringParts.append(string)
-
-            #print every substring
-            for subString in stringParts:
+        else:
+            for page in pages:
                 context.bot.send_message(
-                chat_id=update.effective_message.chat_id,
-                text=subString,
-            )
+                    chat_id=update.effective_message.chat_id,
+                    text=page,
+                )
         return ConversationHandler.END
 
 
+def allSeriesKeyboard(token, page, count):
+    if count <= 1:
+        return None
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀", callback_data=f"allSeries:{token}:{page - 1}"))
+    buttons.append(InlineKeyboardButton(f"{page + 1}/{count}", callback_data=f"allSeries:{token}:{page}"))
+    if page < count - 1:
+        buttons.append(InlineKeyboardButton("▶", callback_data=f"allSeries:{token}:{page + 1}"))
+    return InlineKeyboardMarkup([buttons])
+
+
+@metrics.timed
+def allSeriesPage(update, context):
+    query = update.callback_query
+    if not checkId(update):
+        query.answer()
+        return
+    _, token, page = query.data.split(":")
+    page = int(page)
+    pages = allSeriesPages.get(token)
+    if pages is None:
+        query.answer(text=transcript["Expired"], show_alert=True)
+        return
+    query.answer()
+    if 0 <= page < len(pages) and query.message.text != pages[page]:
+        query.edit_message_text(
+            text=pages[page], reply_markup=allSeriesKeyboard(token, page, len(pages))
+        )
+
+
+@metrics.timed
 def pourcentage(update, context):
     if not checkId(update):
         if (
@@ -651,34 +1026,132 @@ def pourcentage(update, context):
         ):  # To also stop the beginning command
             return ConversationHandler.END
     else:
-        queue = radarr.get_queue_pourcentage()
-        for title in queue:
-            text = "{title} - {pourcent}%".format(title=title, pourcent=queue[title])
-            context.bot.send_message(chat_id=update.effective_message.chat_id,
-                                     text=text)
-        queue = sonarr.get_queue_pourcentage()
-        for title in queue:
-            text = "{title} - {pourcent}%".format(title=title, pourcent=queue[title])
-            context.bot.send_message(chat_id=update.effective_message.chat_id,
-                                     text=text)
+        text, downloading = queueText()
+        message = context.bot.send_message(
+            chat_id=update.effective_message.chat_id, text=text
+        )
+        live = config.get("pourcentageLive", {})
+        if downloading and (live.get("enable", False) or "live" in (context.args or [])):
+            interval = live.get("interval", 10)
+            context.job_queue.run_once(
+                updatePourcentage,
+                interval,
+                context={
+                    "chat_id": message.chat_id,
+                    "message_id": message.message_id,
+                    "text": text,
+                    "interval": interval,
+                    "until": time.monotonic() + live.get("maxDuration", 6 * 3600),
+                },
+            )
         return ConversationHandler.END
 
 
+# Fetch both download queues at the same time and render them as one message
+def queueText():
+    movies = queueExecutor.submit(radarr.get_queue_pourcentage)
+    series = queueExecutor.submit(sonarr.get_queue_pourcentage)
+    # Not merged into one dict, a movie and a series can share a title
+    queue = list(movies.result().items()) + list(series.result().items())
+    lines = [f"{title} - {pourcent}%" for title, pourcent in queue]
+    if not lines:
+        return transcript["Queue empty"], False
+    # One message, the downloads that don't fit are counted at the end
+    page = commons.paginate(lines, TELEGRAM_MAX_LENGTH - 100)[0]
+    hidden = len(lines) - len(page.split("\n"))
+    if hidden > 0:
+        page += f'\n{transcript["Queue more"]}: {hidden}'
+    return page, True
+
+
+# Edit the /pourcentage message in place until the queue is empty
+def updatePourcentage(context):
+    job = context.job.context
+    live = config.get("pourcentageLive", {})
+    interval = job["interval"]
+    try:
+        text, downloading = queueText()
+        if text != job["text"]:
+            context.bot.edit_message_text(
+                chat_id=job["chat_id"], message_id=job["message_id"], text=text
+            )
+            job["text"] = text
+            interval = live.get("interval", 10)
+        else:
+            interval = min(interval * 2, live.get("maxInterval", 120))
+    except RetryAfter as e:
+        downloading = True
+        interval = max(interval, e.retry_after)
+    except Exception as e:
+        logger.warning(f"Updating the download progress failed: {e}")
+        downloading = True
+        interval = min(interval * 2, live.get("maxInterval", 120))
+    if downloading and time.monotonic() < job["until"]:
+        job["interval"] = interval
+        context.job_queue.run_once(updatePourcentage, interval, context=job)
+
+
+@metrics.timed
+def refresh(update, context):
+    if not checkId(update):
+        context.bot.send_message(
+            chat_id=update.effective_message.chat_id, text=transcript["Authorize"]
+        )
+    elif not checkAdmin(update):
+        context.bot.send_message(
+            chat_id=update.effective_message.chat_id, text=transcript["NotAdmin"],
+        )
+    else:
+        for service in [sonarr, radarr]:
+            logger.info(f"{service.__name__} search cache: {service.searchCache.stats()}")
+            service.invalidateCache()
+            service.librarySnapshot.refresh()
+        logger.info(f"Caches refreshed by [{update.message.from_user.username}]")
+        context.bot.send_message(
+            chat_id=update.effective_message.chat_id, text=transcript["Refreshed"],
+        )
+    return ConversationHandler.END
+
+
+@metrics.timed
+def memory(update, context):
+    if not checkId(update):
+        text = transcript["Authorize"]
+    elif not checkAdmin(update):
+        text = transcript["NotAdmin"]
+    else:
+        usage = chatstate.report(dispatcher, conversationHandlers)
+        total = chatstate.totalSize(dispatcher, conversationHandlers)
+        own = update.effective_chat.id
+        entries = [f'{transcript["Memory"]} {len(usage)} chats, {total / 1024:.1f} KB']
+        for chatId, size, keys in usage:
+            marker = " *" if chatId == own else ""
+            entries.append(f"{chatId}{marker}: {size / 1024:.1f} KB ({', '.join(keys)})")
+        text = commons.paginate(entries, TELEGRAM_MAX_LENGTH)[0]
+    context.bot.send_message(chat_id=update.effective_message.chat_id, text=text)
+
+
+@metrics.timed
 def chooseSerie(update, context):
-    oddItem = None
-    my_series = sonarr.allSeries()
-    context.user_data.update({"my_series": my_series})
+    query = " ".join(context.args or [])
+    if not query:
+        context.bot.send_message(
+            chat_id=update.effective_message.chat_id, text=transcript["Season title"]
+        )
+        return CHOOSE_SERIE
+    return sendSerieMatches(update, context, query)
 
-    formattedSeries = [f"{serie['title']}" for serie in my_series]
 
-    if len(formattedSeries) % 2 > 0:
-        oddItem = formattedSeries.pop(-1)
-    reply_keyboard = [
-        [formattedSeries[i], formattedSeries[i + 1]]
-        for i in range(0, len(formattedSeries), 2)
-    ]
-    if oddItem:
-        reply_keyboard.append([oddItem])
+# Offer the few series whose title looks most like the query, instead of a
+# keyboard with the whole library
+def sendSerieMatches(update, context, query):
+    matches = sonarr.titleIndex().search(query, limit=config.get("seasonMatches", 8))
+    if not matches:
+        context.bot.send_message(
+            chat_id=update.effective_message.chat_id, text=transcript["No results"]
+        )
+        return ConversationHandler.END
+    reply_keyboard = [[serie["title"]] for serie in matches]
     markup = ReplyKeyboardMarkup(reply_keyboard, one_time_keyboard=True)
     context.bot.send_message(
         chat_id=update.effective_message.chat_id,
@@ -688,19 +1161,17 @@ def chooseSerie(update, context):
     return CHOOSE_SERIE
 
 
+@metrics.timed
 def chooseSeason(update, context):
-    serieTitle = update.message.text
-    my_series = context.user_data["my_series"]
-    id = None
-    seasonCount = None
+    serie = sonarr.titleIndex().get(update.message.text)
+    if serie is None:
+        # Not one of the offered titles, so take it as a new search
+        return sendSerieMatches(update, context, update.message.text)
+    id = serie["id"]
+    seasonCount = serie["seasonCount"]
     oddItem = None
-    for serie in my_series:
-        if serie["title"] == serieTitle:
-            id = serie["id"]
-            seasonCount = serie["seasonCount"]
-            context.user_data.update({"serie_chosen_id": id})
-            break
     if id and seasonCount:
+        context.user_data.update({"serie_chosen_id": id})
         seasons = []
         for season in range(1, seasonCount + 1):
             seasons.append(f"Saison {season}")
@@ -723,6 +1194,7 @@ def chooseSeason(update, context):
     return ConversationHandler.END
 
 
+@metrics.timed
 def searchSeason(update, context):
     try:
         season_chosen = update.message.text
@@ -731,16 +1203,101 @@ def searchSeason(update, context):
         if sonarr.searchSeason(serie_chosen_id, seasonNumber):
             context.bot.send_message(
                 chat_id=update.effective_message.chat_id,
-                text=transcript["serie"]["SeasonSuccess"],
+                text=transcript[transcript["Serie"].lower()]["SeasonSuccess"],
             )
     except Exception:
         context.bot.send_message(
             chat_id=update.effective_message.chat_id,
-            text=transcript["serie"]["Failed"],
+            text=transcript[transcript["Serie"].lower()]["Failed"],
         )
     return ConversationHandler.END
 
 
+@metrics.timed
+def inlineQuery(update, context):
+    query = update.inline_query
+    userId = query.from_user.id
+    if userId not in authorization.chatIds:
+        query.answer([], cache_time=0, is_personal=True)
+        return
+    if len(query.query.strip()) < inlineMinLength:
+        return
+    with pendingInlineLock:
+        previous = pendingInline.get(userId)
+        if previous is not None:
+            previous.schedule_removal()
+        pendingInline[userId] = context.job_queue.run_once(
+            answerInlineQuery, inlineDebounce, context=query
+        )
+
+
+def answerInlineQuery(context):
+    query = context.job.context
+    userId = query.from_user.id
+    with pendingInlineLock:
+        if pendingInline.get(userId) is not context.job:
+            return
+    try:
+        results = inlineResults(query.query.strip())
+        with pendingInlineLock:
+            # Don't answer a query the user has typed past in the meantime
+            if pendingInline.get(userId) is not context.job:
+                return
+        # Personal, or Telegram would show the cached results to anyone
+        # typing the same query without asking whether they're authorized
+        query.answer(
+            results, cache_time=inlineSettings.get("cacheTime", 300), is_personal=True
+        )
+    except Exception as e:
+        logger.warning(f"Inline query [{query.query}] failed: {e}")
+    finally:
+        with pendingInlineLock:
+            if pendingInline.get(userId) is context.job:
+                del pendingInline[userId]
+
+
+def inlineResults(text):
+    # Both searches go through the search caches, and identical searches
+    # that are already running are shared
+    searches = [
+        (service, choice, inlineExecutor.submit(service.search, text))
+        for service, choice in [(sonarr, transcript["Serie"]), (radarr, transcript["Movie"])]
+    ]
+    results = []
+    for service, choice, search in searches:
+        try:
+            found = search.result()
+        except Exception as e:
+            logger.warning(f"Inline search of {service.__name__} failed: {e}")
+            continue
+        for item in (service.giveTitles(found) if found else [])[:10]:
+            label = f"{item['title']} ({item['year']})"
+            results.append(
+                InlineQueryResultArticle(
+                    id=f"{service.__name__}-{item['id']}",
+                    title=label,
+                    description=choice,
+                    thumb_url=item["poster"],
+                    input_message_content=InputTextMessageContent(label),
+                )
+            )
+    return results
+
+
+# Send a poster by the file_id Telegram gave it the first time it was sent
+def sendPoster(context, chat_id, poster):
+    fileId = store.posters.get(poster)
+    if fileId:
+        try:
+            return context.bot.sendPhoto(chat_id=chat_id, photo=fileId)
+        except BadRequest:
+            logger.debug(f"Cached file_id of [{poster}] was refused, sending the URL")
+            store.posters.remove(poster)
+    message = context.bot.sendPhoto(chat_id=chat_id, photo=poster)
+    if message.photo:
+        store.posters.put(poster, message.photo[-1].file_id)
+    return message
+
 
 def getService(context):
     if context.user_data.get("choice") == transcript["Serie"]:
@@ -755,52 +1312,14 @@ def getService(context):
 
 def clearUserData(context):
     logger.debug(
-        "Removing choice, title, position, paths, and output from context.user_data..."
+        "Removing choice, title, position, paths, profiles and output from context.user_data..."
     )
     for x in [
         x
-        for x in ["choice", "title", "position", "output", "paths", "path"]
+        for x in ["choice", "title", "position", "output", "paths", "path", "profiles"]
         if x in context.user_data.keys()
     ]:
         context.user_data.pop(x)
 
-APP = Flask(__name__)
-
-def flask_start():
-    APP.run("0.0.0.0", port=6200)
-
-@APP.route('/', methods=['GET', 'POST'])
-def notify_chat():
-    data = request.json
-    print(data)
-    id = None
-    try:
-        id = str(data['movie']['tmdbId'])
-        title = data['movie']['title']
-        quality = data['release']['quality']
-        size = data['release']['size'] / 1024 / 1024 / 1024
-        event = data['eventType']
-    except KeyError:
-        print("key error")
-        try:
-            id = str(data['serie']['tvdbId'])
-        except KeyError:
-            return "Not OK"
-    if not id:
-        return "Not OK"
-    with open(REQUESTS_PATH, "r") as json_file:
-        print(f"{title} - {quality} - {size} is {event}")
-        request_json = json.load(json_file)
-        try:
-            chat_id = request_json[id]
-        except KeyError:
-            return "Not OK"
-        text = f"{title} - {quality} - {str(round(size, 2))}Gb is {event}"
-        data_to_send = {'chat_id': {chat_id}, 'text': text}
-        requests.post(f'https://api.telegram.org/bot{config["telegram"]["token"]}/sendMessage', data_to_send)
-    return "hi"
-
 if __name__ == "__main__":
-    flask_thread = threading.Thread(target=flask_start)
-    flask_thread.start()
     main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import threading
+
+from definitions import CHATID_PATH, ADMIN_PATH
+
+
+class IdFile:
+    """Set of the IDs listed one per line in a text file.
+
+    The file is only read again when its mtime changes, and additions are
+    written through to it atomically.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.ids = []
+        self.idSet = frozenset()
+        self.mtime = None
+        self.lock = threading.Lock()
+
+    def reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self.mtime:
+            return
+        with self.lock:
+            ids = []
+            if mtime is not None:
+                with open(self.path, "r") as file:
+                    ids = [line.strip() for line in file if line.strip()]
+            self.ids = ids
+            self.idSet = frozenset(ids)
+            self.mtime = mtime
+
+    def __contains__(self, value):
+        self.reload()
+        return str(value) in self.idSet
+
+    def add(self, value):
+        value = str(value)
+        self.reload()
+        with self.lock:
+            if value in self.idSet:
+                return False
+            ids = self.ids + [value]
+            self.write("".join(f"{i}\n" for i in ids))
+            self.ids = ids
+            self.idSet = frozenset(ids)
+            self.mtime = os.stat(self.path).st_mtime_ns
+        return True
+
+    def write(self, content):
+        directory = os.path.dirname(self.path)
+        fd, tmpPath = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w") as file:
+                file.write(content)
+                file.flush()
+                os.fsync(file.fileno())
+            if os.path.exists(self.path):
+                os.chmod(tmpPath, os.stat(self.path).st_mode & 0o777)
+            os.replace(tmpPath, self.path)
+        except OSError:
+            # A file bind-mounted into a container can't be replaced, so
+            # rewrite it in place instead
+            os.unlink(tmpPath)
+            with open(self.path, "w") as file:
+                file.write(content)
+                file.flush()
+                os.fsync(file.fileno())
+
+
+chatIds = IdFile(CHATID_PATH)
+admins = IdFile(ADMIN_PATH)
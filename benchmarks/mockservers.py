@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""Stand-ins for Sonarr v2, Radarr v3 and the Telegram Bot API.
+
+Run as a script they print their ports as one JSON line and serve until
+killed. GET /_control?librarySize=N&latency=S on any of them changes the
+library size and the latency of all three.
+"""
+
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class MockState:
+    """Library size and latency shared by the mock servers."""
+
+    def __init__(self, librarySize=100, latency=0.0):
+        self.librarySize = librarySize
+        self.latency = latency
+        self.ids = itertools.count(10_000_000)
+        self.messageIds = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def nextId(self):
+        with self.lock:
+            return next(self.ids)
+
+
+def series(i):
+    return {
+        "tvdbId": i,
+        "tvRageId": 0,
+        "id": i,
+        "title": f"Series {i}",
+        "titleSlug": f"series-{i}",
+        "sortTitle": f"series {i}",
+        "year": 1990 + i % 30,
+        "status": "continuing" if i % 3 else "ended",
+        "monitored": bool(i % 2),
+        "seasonCount": 1 + i % 8,
+        "overview": "An overview that is long enough to look like a real one. " * 4,
+        "remotePoster": f"http://posters.invalid/series/{i}.jpg",
+        "images": [
+            {"coverType": kind, "url": f"/MediaCover/{i}/{kind}.jpg"}
+            for kind in ("banner", "poster", "fanart")
+        ],
+        "seasons": [
+            {"seasonNumber": s, "monitored": True, "statistics": {"episodeCount": 10}}
+            for s in range(1 + i % 8)
+        ],
+        "statistics": {"sizeOnDisk": i * 1024, "episodeFileCount": 10},
+    }
+
+
+def movie(i):
+    return {
+        "tmdbId": i,
+        "id": i,
+        "title": f"Movie {i}",
+        "titleSlug": f"movie-{i}",
+        "year": 1990 + i % 30,
+        "status": "released",
+        "monitored": bool(i % 2),
+        "overview": "An overview that is long enough to look like a real one. " * 4,
+        "remotePoster": f"http://posters.invalid/movies/{i}.jpg",
+        "images": [
+            {"coverType": kind, "url": f"/MediaCover/{i}/{kind}.jpg"}
+            for kind in ("poster", "fanart")
+        ],
+    }
+
+
+def makeHandler(state, routes):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def handle_one(self, method):
+            if state.latency:
+                time.sleep(state.latency)
+            url = urlparse(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            path = url.path.lower()
+            handlers = routes
+            if path == "/_control":
+                query = parse_qs(url.query)
+                if "librarySize" in query:
+                    state.librarySize = int(query["librarySize"][0])
+                if "latency" in query:
+                    state.latency = float(query["latency"][0])
+                handlers = [("/_control", lambda *args: (200, {"ok": True}))]
+            for prefix, route in handlers:
+                if path.startswith(prefix):
+                    status, payload = route(
+                        method, path[len(prefix):], parse_qs(url.query), body
+                    )
+                    break
+            else:
+                status, payload = 404, {"error": "not found"}
+            data = json.dumps(payload).encode("utf8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self.handle_one("GET")
+
+        def do_POST(self):
+            self.handle_one("POST")
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def sonarrRoutes(state):
+    def route(method, path, query, body):
+        if path == "series" and method == "GET":
+            return 200, [series(i) for i in range(1, state.librarySize + 1)]
+        if path == "series" and method == "POST":
+            added = json.loads(body)
+            return 201, dict(series(added["tvdbId"]), **added, id=added["tvdbId"])
+        if path == "series/lookup":
+            return 200, [series(state.nextId()) for _ in range(5)]
+        if path == "rootfolder":
+            return 200, [{"path": "/tv/", "freeSpace": 1, "unmappedFolders": []}]
+        if path == "profile":
+            return 200, [{"id": 1, "name": "HD-1080p"}, {"id": 2, "name": "Any"}]
+        if path == "queue":
+            return 200, [
+                {"title": f"Series {i}", "status": "Downloading", "size": 100, "sizeleft": i}
+                for i in range(20)
+            ]
+        return 404, {}
+
+    return [("/api/", route)]
+
+
+def radarrRoutes(state):
+    def route(method, path, query, body):
+        if path == "movie" and method == "GET":
+            return 200, [movie(i) for i in range(1, state.librarySize + 1)]
+        if path == "movie" and method == "POST":
+            added = json.loads(body)
+            return 201, dict(movie(added["tmdbId"]), **added, id=added["tmdbId"])
+        if path == "movie/lookup/tmdb":
+            return 200, movie(int(query["tmdbId"][0]))
+        if path == "movie/lookup":
+            return 200, [movie(state.nextId()) for _ in range(5)]
+        if path == "rootfolder":
+            return 200, [{"path": "/movies/", "freeSpace": 1}]
+        if path == "qualityprofile":
+            return 200, [{"id": 1, "name": "HD-1080p"}, {"id": 2, "name": "Any"}]
+        if path == "queue":
+            return 200, {"records": [
+                {"title": f"Movie {i}", "status": "downloading", "size": 100, "sizeleft": i}
+                for i in range(20)
+            ]}
+        return 404, {}
+
+    return [("/api/v3/", route)]
+
+
+def telegramRoutes(state):
+    def route(method, path, query, body):
+        # path is "<token>/<method>"
+        apiMethod = path.rsplit("/", 1)[-1]
+        message = {
+            "message_id": next(state.messageIds),
+            "date": int(time.time()),
+            "chat": {"id": 1, "type": "private"},
+        }
+        if apiMethod == "sendphoto":
+            message["photo"] = [
+                {"file_id": f"file-{message['message_id']}", "file_unique_id": "u",
+                 "width": 100, "height": 150}
+            ]
+        elif apiMethod == "getme":
+            return 200, {"ok": True, "result": {
+                "id": 1, "is_bot": True, "first_name": "Addarr", "username": "addarrbot"
+            }}
+        else:
+            message["text"] = "ok"
+        return 200, {"ok": True, "result": message}
+
+    return [("/bot", route)]
+
+
+def serve(routes, state):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), makeHandler(state, routes))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def startAll(state):
+    """Start the Sonarr, Radarr and Telegram stand-ins and return their ports."""
+    return {
+        "sonarr": serve(sonarrRoutes(state), state).server_address[1],
+        "radarr": serve(radarrRoutes(state), state).server_address[1],
+        "telegram": serve(telegramRoutes(state), state).server_address[1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--library-size", type=int, default=100)
+    args = parser.parse_args()
+    state = MockState(args.library_size, args.latency)
+    print(json.dumps(startAll(state)), flush=True)
+    threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""Benchmarks of Addarr against local stand-ins for Sonarr, Radarr and Telegram.
+
+    python benchmarks/run.py --latency 0.05 --output results.json
+
+Results are written as JSON so runs of different releases can be compared.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+from types import SimpleNamespace
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import definitions  # noqa: E402
+
+
+def startMockServers(latency):
+    # In their own process, so they don't count towards the measured memory
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(ROOT_DIR, "benchmarks", "mockservers.py"),
+            "--latency",
+            str(latency),
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    return process, json.loads(process.stdout.readline())
+
+
+def setLibrarySize(ports, size):
+    for app in ("sonarr", "radarr"):
+        urllib.request.urlopen(
+            f"http://127.0.0.1:{ports[app]}/_control?librarySize={size}"
+        ).read()
+
+
+def configure(workdir, ports):
+    """Point Addarr at the mock servers and keep its files in `workdir`."""
+    config = {
+        "language": "en",
+        "logToConsole": False,
+        "telegram": {"token": "123456:BENCHMARK", "password": "benchmark"},
+        "entrypointAuth": "auth",
+        "entrypointAdd": "start",
+        "entrypointAllSeries": "allSeries",
+        "entrypointTransmission": "transmission",
+        "entrypointPourcentage": "pourcentage",
+        "season": "season",
+        "transmission": {"enable": False},
+        "notifications": {"enable": False},
+    }
+    for app in ("sonarr", "radarr"):
+        config[app] = {
+            "server": {"addr": "127.0.0.1", "port": ports[app], "path": "/", "ssl": False},
+            "auth": {"apikey": "benchmark"},
+            "search": False,
+            "seasonFolder": True,
+        }
+    with open(os.path.join(workdir, "config.yaml"), "w") as file:
+        json.dump(config, file)
+    for name, fileName in [
+        ("CONFIG_PATH", "config.yaml"),
+        ("CHATID_PATH", "chatid.txt"),
+        ("ADMIN_PATH", "admin.txt"),
+        ("LOG_PATH", os.path.join("logs", "addarr.log")),
+        ("REQUESTS_PATH", "user_requests.json"),
+        ("REQUESTS_DB_PATH", "user_requests.db"),
+        ("SONARR_LIBRARY_PATH", "sonarr_library.json"),
+        ("RADARR_LIBRARY_PATH", "radarr_library.json"),
+    ]:
+        setattr(definitions, name, os.path.join(workdir, fileName))
+    # The chat of makeUpdate, so the handlers don't stop at checkId
+    with open(os.path.join(workdir, "chatid.txt"), "w") as file:
+        file.write("1\n")
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+    }
+
+
+def peakMemory(function):
+    tracemalloc.start()
+    try:
+        function()
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def makeUpdate(bot, text, updateId=1):
+    from telegram import Update
+
+    return Update.de_json(
+        {
+            "update_id": updateId,
+            "message": {
+                "message_id": updateId,
+                "date": int(time.time()),
+                "chat": {"id": 1, "type": "private"},
+                "from": {"id": 1, "is_bot": False, "first_name": "Bench", "username": "bench"},
+                "text": text,
+            },
+        },
+        bot,
+    )
+
+
+def addFlow(addarr, bot, choice, title):
+    """One searchSerieMovie -> addSerieMovie conversation."""
+    transcript = addarr.transcript
+    context = SimpleNamespace(bot=bot, user_data={"title": title, "choice": choice}, args=[])
+    addarr.searchSerieMovie(makeUpdate(bot, choice), context)
+    addarr.pathSerieMovie(makeUpdate(bot, transcript[choice.lower()]["Add"]), context)
+    addarr.addSerieMovie(makeUpdate(bot, "HD-1080p"), context)
+
+
+def benchAddFlow(addarr, bot, adds):
+    results = {}
+    for choice in (addarr.transcript["Serie"], addarr.transcript["Movie"]):
+        samples = []
+        for i in range(adds):
+            begin = time.perf_counter()
+            addFlow(addarr, bot, choice, f"{choice} benchmark {i}")
+            samples.append(time.perf_counter() - begin)
+        results[choice.lower()] = dict(
+            summarize(samples),
+            peak_kb=peakMemory(lambda: addFlow(addarr, bot, choice, f"{choice} memory")),
+        )
+    return results
+
+
+def benchAllSeries(addarr, bot, ports, sizes):
+    results = {}
+    update = makeUpdate(bot, "/allSeries")
+    context = SimpleNamespace(bot=bot, user_data={}, args=[])
+
+    def render():
+        addarr.allSeriesPages.invalidate()
+        addarr.allSeries(update, context)
+
+    for size in sizes:
+        setLibrarySize(ports, size)
+        begin = time.perf_counter()
+        addarr.sonarr.librarySnapshot.refresh()
+        sync = time.perf_counter() - begin
+        renders = []
+        for _ in range(5):
+            begin = time.perf_counter()
+            render()
+            renders.append(time.perf_counter() - begin)
+        if addarr.allSeriesPages.stats()["size"] == 0:
+            raise RuntimeError("allSeries didn't render a page, check the benchmark setup")
+        results[str(size)] = {
+            "sync_ms": round(sync * 1000, 3),
+            "render": summarize(renders),
+            "sync_peak_kb": peakMemory(addarr.sonarr.librarySnapshot.refresh),
+            "render_peak_kb": peakMemory(render),
+        }
+    return results
+
+
+def benchWebhook(webhooks, threads):
+    import store
+    import webhook
+
+    client = webhook.APP.test_client()
+    for mediaId in range(1, 101):
+        store.userRequests.add(mediaId, 1)
+    samples = []
+    lock = threading.Lock()
+
+    def post(start):
+        for i in range(start, webhooks, threads):
+            payload = {
+                "eventType": "Grab",
+                "downloadId": f"benchmark-{i}",
+                "movie": {"tmdbId": 1 + i % 100, "title": f"Movie {i}"},
+                "release": {"quality": "HD-1080p", "size": 4 * 1024 ** 3},
+            }
+            begin = time.perf_counter()
+            client.post("/", json=payload)
+            with lock:
+                samples.append(time.perf_counter() - begin)
+
+    begin = time.perf_counter()
+    workers = [threading.Thread(target=post, args=(t,)) for t in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - begin
+    return dict(
+        summarize(samples), threads=threads, requests_per_s=round(webhooks / elapsed, 1)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds every mock server waits before answering")
+    parser.add_argument("--sizes", default="100,1000,5000,20000",
+                        help="library sizes for the allSeries benchmark")
+    parser.add_argument("--adds", type=int, default=20, help="add flows per service")
+    parser.add_argument("--webhooks", type=int, default=500, help="webhook calls")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent webhook callers")
+    parser.add_argument("--output", help="write the results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="addarr-benchmark-")
+    mockServers, ports = startMockServers(args.latency)
+    configure(workdir, ports)
+
+    import addarr
+    import store
+    from telegram import Bot
+
+    store.init()
+
+    bot = Bot(
+        "123456:BENCHMARK", base_url=f"http://127.0.0.1:{ports['telegram']}/bot"
+    )
+    try:
+        results = {
+            "version": addarr.__version__,
+            "python": platform.python_version(),
+            "latency_s": args.latency,
+            "add_flow": benchAddFlow(addarr, bot, args.adds),
+            "all_series": benchAllSeries(
+                addarr, bot, ports, [int(size) for size in args.sizes.split(",")]
+            ),
+            "webhook": benchWebhook(args.webhooks, args.threads),
+        }
+    finally:
+        mockServers.terminate()
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import csv
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import logger
+from settings import config
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.bulk", logLevel, config.get("logToConsole", False))
+
+settings = config.get("bulk", {})
+workers = settings.get("workers", 4)
+maxTitles = settings.get("maxTitles", 500)
+
+# "Title (2010)"
+YEAR = re.compile(r"^(.*\S)\s*\((\d{4})\)$")
+
+ADDED, SKIPPED, NOT_FOUND, FAILED = "added", "skipped", "not found", "failed"
+
+
+def parseTitles(text, isCsv=False):
+    """(title, year) pairs from a pasted list or a text/CSV file, and how
+    many titles were left out over maxTitles.
+
+    A line is one title, a year in brackets after it or after a last comma
+    picks between results. Only CSV files are split in columns: the first
+    one is the title, an optional second one the year. Duplicates and a
+    header row named "title" are dropped.
+    """
+    if isCsv:
+        rows = csv.reader(text.splitlines())
+    else:
+        rows = (splitYear(line) for line in text.splitlines())
+    titles = []
+    seen = set()
+    for row in rows:
+        cells = [cell.strip() for cell in row if cell.strip()]
+        if not cells or cells[0].lower() == "title":
+            continue
+        title, year = cells[0], None
+        if len(cells) > 1 and cells[1].isdigit():
+            year = int(cells[1])
+        else:
+            match = YEAR.match(title)
+            if match:
+                title, year = match.group(1), int(match.group(2))
+        if (title.lower(), year) not in seen:
+            seen.add((title.lower(), year))
+            titles.append((title, year))
+    return titles[:maxTitles], max(len(titles) - maxTitles, 0)
+
+
+def splitYear(line):
+    # "Title, 2010", but "Love, Death & Robots" is one title
+    title, _, year = line.rpartition(",")
+    if title.strip() and re.fullmatch(r"\s*\d{4}\s*", year):
+        return [title, year]
+    return [line]
+
+
+def addOne(service, title, year, path, profile, claimed, lock):
+    try:
+        searchResult = service.search(title)
+        results = service.giveTitles(searchResult) if searchResult else []
+        if year is not None:
+            results = [result for result in results if result["year"] == year]
+        if not results:
+            return NOT_FOUND, None
+        mediaId = results[0]["id"]
+        # Also skip a title that is twice in the list under another name
+        with lock:
+            if mediaId in claimed or service.inLibrary(mediaId):
+                return SKIPPED, mediaId
+            claimed.add(mediaId)
+        if service.addToLibrary(mediaId, path, profile):
+            return ADDED, mediaId
+        return FAILED, mediaId
+    except Exception as e:
+        logger.warning(f"Bulk add of {title} failed: {e}")
+        return FAILED, None
+
+
+def addAll(service, titles, path, profile):
+    """Search and add `titles` with at most `workers` requests at a time.
+
+    Returns a list of (title, outcome, id) in the order of `titles`. The
+    library snapshot is loaded once up front, so checking whether a title
+    is already there doesn't hit the network.
+    """
+    service.librarySnapshot.ensureLoaded()
+    claimed = set()
+    lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk") as pool:
+        outcomes = pool.map(
+            lambda item: addOne(service, *item, path, profile, claimed, lock),
+            titles,
+        )
+        return [(title, *outcome) for (title, year), outcome in zip(titles, outcomes)]
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+import logging
+import sys
+import threading
+import time
+from typing import NamedTuple
+
+import logger
+from settings import config
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.chatstate", logLevel, config.get("logToConsole", False))
+
+settings = config.get("chatState", {})
+# Conversations and the data of chats are dropped after this many idle seconds
+idleTimeout = settings.get("idleTimeout", 900)
+sweepInterval = settings.get("sweepInterval", 60)
+maxResults = settings.get("maxResults", 20)
+maxTitleLength = settings.get("maxTitleLength", 256)
+
+
+class SearchResult(NamedTuple):
+    """What the add conversation needs of one search result."""
+
+    id: int
+    title: str
+    year: int
+    poster: str
+
+
+def compactResults(results):
+    return [
+        SearchResult(
+            result["id"], result["title"][:maxTitleLength], result["year"], result["poster"]
+        )
+        for result in results[:maxResults]
+    ]
+
+
+# Users and chats are tracked apart: in a group one user going quiet
+# doesn't make the chat idle
+lastActivity = {}
+chatActivity = {}
+# Users heard from in every chat, for the memory report
+chatMembers = {}
+lastActivityLock = threading.Lock()
+
+
+def touch(update, context):
+    """Remember when a user and a chat were last heard from, runs before every
+    handler."""
+    now = time.monotonic()
+    with lastActivityLock:
+        if update.effective_user:
+            lastActivity[update.effective_user.id] = now
+        if update.effective_chat:
+            chatActivity[update.effective_chat.id] = now
+            if update.effective_user:
+                chatMembers.setdefault(update.effective_chat.id, set()).add(
+                    update.effective_user.id
+                )
+
+
+def sweep(dispatcher):
+    """Forget the data of users and chats that have been idle for idleTimeout."""
+    deadline = time.monotonic() - idleTimeout
+    with lastActivityLock:
+        idleUsers = [userId for userId, seen in lastActivity.items() if seen < deadline]
+        for userId in idleUsers:
+            del lastActivity[userId]
+        idleChats = [chatId for chatId, seen in chatActivity.items() if seen < deadline]
+        for chatId in idleChats:
+            del chatActivity[chatId]
+            chatMembers.pop(chatId, None)
+        for members in chatMembers.values():
+            members.difference_update(idleUsers)
+    for userId in idleUsers:
+        dispatcher.user_data.pop(userId, None)
+    for chatId in idleChats:
+        dispatcher.chat_data.pop(chatId, None)
+    if idleUsers or idleChats:
+        logger.debug(
+            f"Dropped the state of {len(idleUsers)} idle users and {len(idleChats)} idle chats"
+        )
+
+
+def deepSize(value, seen=None):
+    """Approximate number of bytes used by `value` and what it contains."""
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deepSize(k, seen) + deepSize(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deepSize(item, seen) for item in value)
+    return size
+
+
+def conversationsByChat(conversationHandlers):
+    states = {}
+    for handler in conversationHandlers:
+        if not handler.per_chat:
+            continue
+        # Keyed by (chat id, user id) or (chat id, user id, message id)
+        for key, state in list(handler.conversations.items()):
+            states.setdefault(key[0], []).append(state)
+    return states
+
+
+def report(dispatcher, conversationHandlers=()):
+    """(chat id, bytes, keys) of every chat with stored data, largest first.
+
+    A chat holds its chat_data, the user_data of the users heard from in
+    it and its conversations. The data of a user in several chats counts
+    for each of them.
+    """
+    with lastActivityLock:
+        members = {chatId: list(users) for chatId, users in chatMembers.items()}
+    conversations = conversationsByChat(conversationHandlers)
+    usage = []
+    for chatId in set(dispatcher.chat_data) | set(members) | set(conversations):
+        chatData = dispatcher.chat_data.get(chatId) or {}
+        userData = [
+            dispatcher.user_data[userId]
+            for userId in members.get(chatId, [])
+            if dispatcher.user_data.get(userId)
+        ]
+        states = conversations.get(chatId, [])
+        if not chatData and not userData and not states:
+            continue
+        keys = set(map(str, chatData))
+        for data in userData:
+            keys.update(map(str, data))
+        if states:
+            keys.add("conversation")
+        usage.append((chatId, deepSize([chatData, userData, states]), sorted(keys)))
+    return sorted(usage, key=lambda entry: entry[1], reverse=True)
+
+
+def totalSize(dispatcher, conversationHandlers=()):
+    """Bytes of all chat_data, user_data and conversations, each counted once."""
+    return deepSize(
+        [
+            dict(dispatcher.chat_data),
+            dict(dispatcher.user_data),
+            [dict(handler.conversations) for handler in conversationHandlers],
+        ]
+    )
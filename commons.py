@@ -1,10 +1,14 @@
-import yaml
+import codecs
+import json
 import logging
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 import logger
-from definitions import CONFIG_PATH
-
-config = yaml.safe_load(open(CONFIG_PATH, encoding="utf8"))
+import metrics
+from settings import config
 
 # Set up logging
 logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
@@ -33,6 +37,11 @@ def cleanUrl(text):
     return url
 
 
+def normalizeTitle(title):
+    # Case and whitespace don't change what Sonarr/Radarr find
+    return " ".join(title.casefold().split())
+
+
 def generateApiQuery(app, endpoint, parameters={}):
     try:
         apikey = config[app]["auth"]["apikey"]
@@ -51,3 +60,138 @@ def generateApiQuery(app, endpoint, parameters={}):
         return cleanUrl(url)  # Clean URL (validate) and return as string
     except Exception as e:
         logger.warn(f"Generate of APIQUERY failed: {e}.")
+
+
+def paginate(entries, limit=4096):
+    """Join entries with newlines into pages of at most `limit` characters.
+
+    Pages only break between entries, unless a single entry is too long.
+    """
+    pages = []
+    current = []
+    size = 0
+    for entry in entries:
+        if len(entry) > limit:
+            if current:
+                pages.append("\n".join(current))
+                current = []
+                size = 0
+            while len(entry) > limit:
+                pages.append(entry[:limit])
+                entry = entry[limit:]
+        if current and size + 1 + len(entry) > limit:
+            pages.append("\n".join(current))
+            current = []
+            size = 0
+        size += len(entry) + (1 if current else 0)
+        current.append(entry)
+    if current:
+        pages.append("\n".join(current))
+    return pages
+
+
+def iterJsonArray(response, chunkSize=65536):
+    """Yield the items of the JSON array in a streamed response one by one.
+
+    Only the item being decoded and the unread part of the last chunk are
+    held in memory, however long the array is.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    started = False
+    chunks = response.iter_content(chunkSize)
+    done = False
+    while not done:
+        chunk = next(chunks, None)
+        if chunk is None:
+            done = True
+            buffer += utf8.decode(b"", final=True)
+        else:
+            buffer += utf8.decode(chunk)
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos == len(buffer):
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("Response is not a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                if done:
+                    raise
+                break
+            if buffer[pos] not in "{[\"" and not done:
+                # A number or literal ends at the next "," or "]", until then
+                # it may continue in the next chunk, e.g. "1." + "5"
+                after = end
+                while after < len(buffer) and buffer[after] in " \t\r\n":
+                    after += 1
+                if after == len(buffer) or buffer[after] not in ",]":
+                    break
+            yield item
+            pos = end
+        buffer = buffer[pos:]
+    if not started:
+        raise ValueError("Response is not a JSON array")
+    raise ValueError("JSON array is truncated")
+
+
+class ApiClient:
+    """Pooled keep-alive HTTP client for one Sonarr/Radarr instance.
+
+    Optional settings are read from the `http` section of the app config:
+    connectTimeout, readTimeout, retries, backoff and poolSize.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        http = config[app].get("http", {})
+        self.timeout = (http.get("connectTimeout", 5), http.get("readTimeout", 30))
+        retry = Retry(
+            total=http.get("retries", 3),
+            backoff_factor=http.get("backoff", 0.5),
+            status_forcelist=[500, 502, 503, 504],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=http.get("poolSize", 10), max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(
+            {"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"}
+        )
+
+    def request(self, method, endpoint, parameters={}, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        begin = time.perf_counter()
+        try:
+            response = self.session.request(
+                method, generateApiQuery(self.app, endpoint, parameters), **kwargs
+            )
+        except requests.RequestException:
+            metrics.upstreamErrors.inc(self.app, endpoint)
+            raise
+        finally:
+            metrics.upstreamSeconds.observe(
+                time.perf_counter() - begin, self.app, endpoint
+            )
+        if response.status_code >= 400:
+            metrics.upstreamErrors.inc(self.app, endpoint)
+        return response
+
+    def get(self, endpoint, parameters={}, **kwargs):
+        return self.request("GET", endpoint, parameters, **kwargs)
+
+    def post(self, endpoint, parameters={}, **kwargs):
+        return self.request("POST", endpoint, parameters, **kwargs)
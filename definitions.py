@@ -9,4 +9,7 @@ LANG_PATH = os.path.join(ROOT_DIR, "lang.yaml")
 CHATID_PATH = os.path.join(ROOT_DIR, "chatid.txt")
 LOG_PATH = os.path.join(ROOT_DIR, "logs", "addarr.log")
 ADMIN_PATH = os.path.join(ROOT_DIR, "admin.txt")
-REQUESTS_PATH = os.path.join(ROOT_DIR, "user_requests.json")
\ No newline at end of file
+REQUESTS_PATH = os.path.join(ROOT_DIR, "user_requests.json")
+REQUESTS_DB_PATH = os.path.join(ROOT_DIR, "user_requests.db")
+SONARR_LIBRARY_PATH = os.path.join(ROOT_DIR, "sonarr_library.json")
+RADARR_LIBRARY_PATH = os.path.join(ROOT_DIR, "radarr_library.json")
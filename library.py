@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import os
+import tempfile
+import threading
+
+import logger
+from settings import config
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.library", logLevel, config.get("logToConsole", False))
+
+
+class LibrarySnapshot:
+    """Local copy of a Sonarr/Radarr library, kept in memory and on disk.
+
+    Only the `fields` of every item are kept, keyed by `idKey`. The snapshot
+    is loaded from `path` at startup, synced in the background every `ttl`
+    seconds and updated immediately through put(), so lookups never have to
+    hit the network. `version` changes whenever the content does.
+    """
+
+    def __init__(self, name, fetch, idKey, fields, path, ttl):
+        self.name = name
+        self.fetch = fetch
+        self.idKey = idKey
+        self.fields = fields
+        self.path = path
+        self.ttl = ttl
+        self.items = None
+        self.list = []
+        self.version = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.wakeUp = threading.Event()
+        self.thread = None
+
+    def project(self, item):
+        return {field: item.get(field) for field in self.fields}
+
+    def swap(self, items):
+        # Callers hold self.lock
+        self.items = items
+        self.list = list(items.values())
+        self.version += 1
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf8") as file:
+                saved = json.load(file)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            logger.warning(f"Ignoring unreadable {self.name} library snapshot: {e}")
+            return
+        fields = saved["fields"]
+        items = {}
+        for row in saved["rows"]:
+            item = self.project(dict(zip(fields, row)))
+            items[item[self.idKey]] = item
+        with self.lock:
+            if self.items is None:
+                self.swap(items)
+        logger.debug(f"Loaded {self.name} library snapshot: {len(items)} items")
+
+    def save(self):
+        with self.lock:
+            rows = [[item[field] for field in self.fields] for item in self.list]
+        content = json.dumps(
+            {"fields": self.fields, "rows": rows}, separators=(",", ":")
+        )
+        fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=".tmp-")
+        with os.fdopen(fd, "w", encoding="utf8") as file:
+            file.write(content)
+        os.replace(tmpPath, self.path)
+
+    def refresh(self):
+        items = {}
+        for item in self.fetch():
+            item = self.project(item)
+            items[item[self.idKey]] = item
+        with self.lock:
+            changed = items != self.items
+            if changed:
+                self.swap(items)
+        if changed:
+            self.save()
+        logger.debug(
+            f"Synced {self.name} library: {len(items)} items, "
+            + ("changed" if changed else "unchanged")
+        )
+
+    def ensureLoaded(self):
+        if self.items is None:
+            with self.lock:
+                loaded = self.items is not None
+            if not loaded:
+                self.refresh()
+
+    def contains(self, mediaId):
+        self.ensureLoaded()
+        return mediaId in self.items
+
+    def all(self):
+        self.ensureLoaded()
+        return self.list
+
+    def view(self):
+        # The items together with the version they belong to
+        self.ensureLoaded()
+        with self.lock:
+            return self.version, self.list
+
+    def put(self, item):
+        item = self.project(item)
+        with self.lock:
+            if self.items is not None:
+                items = dict(self.items)
+                items[item[self.idKey]] = item
+                self.swap(items)
+        # Pick up whatever else changed upstream in the background
+        self.wakeUp.set()
+
+    def start(self):
+        if self.thread is None:
+            self.load()
+            self.thread = threading.Thread(
+                target=self.run, name=f"{self.name}-library", daemon=True
+            )
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeUp.set()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.wakeUp.clear()
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Sync of {self.name} library failed: {e}")
+            self.wakeUp.wait(self.ttl)
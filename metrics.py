@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Metrics in the Prometheus text exposition format, served on /metrics
+
+registry = []
+collectors = []
+caches = {}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def formatLabels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelNames=()):
+        self.name = name
+        self.help = help
+        self.labelNames = labelNames
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self.lock:
+            values = list(self.values.items())
+        for labels, value in values:
+            yield f"{self.name}{formatLabels(self.labelNames, labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name, help, labelNames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelNames = labelNames
+        self.buckets = buckets
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                # One count per bucket, then +Inf, then the sum
+                counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - begin, *labels)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self.lock:
+            values = [(labels, list(counts)) for labels, counts in self.values.items()]
+        names = self.labelNames + ("le",)
+        for labels, counts in values:
+            total = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                total += count
+                yield f"{self.name}_bucket{formatLabels(names, labels + (bound,))} {total}"
+            yield f"{self.name}_count{formatLabels(self.labelNames, labels)} {total}"
+            yield f"{self.name}_sum{formatLabels(self.labelNames, labels)} {counts[-1]}"
+
+
+def gauge(name, help, read):
+    """Register a gauge whose value is read with `read()` at scrape time."""
+
+    def render():
+        yield f"# HELP {name} {help}"
+        yield f"# TYPE {name} gauge"
+        yield f"{name} {read()}"
+
+    collectors.append(render)
+
+
+def registerCache(name, cache):
+    caches[name] = cache
+
+
+def renderCaches():
+    stats = [(name, cache.stats()) for name, cache in list(caches.items())]
+    for metric, key, help in [
+        ("addarr_cache_hits_total", "hits", "Cache lookups that found an entry."),
+        ("addarr_cache_misses_total", "misses", "Cache lookups that found nothing."),
+        ("addarr_cache_entries", "size", "Entries currently in the cache."),
+    ]:
+        yield f"# HELP {metric} {help}"
+        yield f"# TYPE {metric} {'gauge' if key == 'size' else 'counter'}"
+        for name, values in stats:
+            yield f"{metric}{formatLabels(('cache',), (name,))} {values[key]}"
+
+
+collectors.append(renderCaches)
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    for collector in collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
+
+
+handlerSeconds = Histogram(
+    "addarr_handler_seconds", "Time spent in Telegram update handlers.", ("handler",)
+)
+upstreamSeconds = Histogram(
+    "addarr_upstream_request_seconds",
+    "Latency of Sonarr/Radarr API requests.",
+    ("service", "endpoint"),
+)
+upstreamErrors = Counter(
+    "addarr_upstream_errors_total",
+    "Sonarr/Radarr API requests that failed or returned an error status.",
+    ("service", "endpoint"),
+)
+telegramSeconds = Histogram(
+    "addarr_telegram_request_seconds", "Latency of Telegram Bot API calls.", ("method",)
+)
+webhookEvents = Counter(
+    "addarr_webhook_events_total", "Sonarr/Radarr webhook calls by event type.", ("event",)
+)
+
+
+def timed(handler):
+    """Record how long every call of a handler takes."""
+
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        with handlerSeconds.time(handler.__name__):
+            return handler(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import logging
+import threading
+import time
+import requests
+
+import logger
+import metrics
+import store
+from settings import config
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.notifier", logLevel, config.get("logToConsole", False))
+
+settings = config.get("notifications", {})
+maxAttempts = settings.get("maxAttempts", 8)
+retryDelay = settings.get("retryDelay", 5)
+maxRetryDelay = settings.get("maxRetryDelay", 600)
+pollInterval = settings.get("pollInterval", 5)
+keepFor = settings.get("keepFor", 7 * 24 * 3600)
+
+session = requests.Session()
+wakeUp = threading.Event()
+
+
+def parseEvent(data):
+    """Return (eventKey, mediaId, text) for a Sonarr/Radarr webhook payload.
+
+    Returns None when the payload isn't about a movie or series.
+    """
+    if not isinstance(data, dict) or not data.get("eventType"):
+        return None
+    media = data.get("movie") or data.get("series")
+    if not isinstance(media, dict):
+        return None
+    mediaId = media.get("tmdbId") or media.get("tvdbId")
+    if not mediaId:
+        return None
+    event = data["eventType"]
+    release = data.get("release") or data.get("movieFile") or data.get("episodeFile") or {}
+    if release:
+        size = (release.get("size") or 0) / 1024 / 1024 / 1024
+        text = f"{media.get('title')} - {release.get('quality')} - {str(round(size, 2))}Gb is {event}"
+    else:
+        text = f"{media.get('title')} is {event}"
+
+    if data.get("downloadId"):
+        eventKey = f"{event}:{mediaId}:{data['downloadId']}"
+    else:
+        eventKey = hashlib.sha1(
+            json.dumps(data, sort_keys=True).encode("utf8")
+        ).hexdigest()
+    return eventKey, str(mediaId), text
+
+
+def enqueue(data):
+    """Queue the notification for a webhook payload.
+
+    Returns False when the payload is invalid or nobody requested the media.
+    """
+    event = parseEvent(data)
+    if event is None:
+        return False
+    eventKey, mediaId, text = event
+    chat_id = store.userRequests.get(mediaId)
+    if chat_id is None:
+        return False
+    if store.notifications.enqueue(eventKey, chat_id, text):
+        wakeUp.set()
+    else:
+        logger.debug(f"Ignoring duplicate webhook event {eventKey}")
+    return True
+
+
+def send(chat_id, text):
+    """Send a message to Telegram, returning the seconds to wait on failure."""
+    try:
+        with metrics.telegramSeconds.time("sendMessage"):
+            req = session.post(
+                f'https://api.telegram.org/bot{config["telegram"]["token"]}/sendMessage',
+                data={"chat_id": chat_id, "text": text},
+                timeout=(5, 30),
+            )
+    except requests.RequestException as e:
+        logger.warning(f"Sending notification to {chat_id} failed: {e}")
+        return retryDelay
+    if req.status_code == 200:
+        return 0
+    if req.status_code == 429:
+        return req.json().get("parameters", {}).get("retry_after", retryDelay)
+    if 400 <= req.status_code < 500:
+        # The chat is gone or blocked the bot, retrying won't help
+        return None
+    return retryDelay
+
+
+def deliver():
+    for eventKey, chat_id, text, attempts in store.notifications.due():
+        wait = send(chat_id, text)
+        if wait == 0:
+            store.notifications.markDelivered(eventKey)
+        elif wait is None or attempts + 1 >= maxAttempts:
+            logger.warning(f"Giving up on notification {eventKey} for {chat_id}")
+            store.notifications.markFailed(eventKey)
+        else:
+            store.notifications.retryLater(
+                eventKey, min(max(wait, retryDelay * 2 ** attempts), maxRetryDelay)
+            )
+
+
+def run():
+    lastPurge = 0
+    while True:
+        wakeUp.clear()
+        try:
+            deliver()
+            if time.monotonic() - lastPurge > 3600:
+                store.notifications.purge(keepFor)
+                lastPurge = time.monotonic()
+        except Exception as e:
+            logger.error(f"Delivering notifications failed: {e}")
+        wakeUp.wait(pollInterval)
+
+
+def start():
+    thread = threading.Thread(target=run, name="notifier", daemon=True)
+    thread.start()
+    return thread
@@ -1,31 +1,59 @@
 #!/usr/bin/env python3
 
+import cache
 import commons as commons
 import json
+import library
 import logging
-import requests
-import yaml
 
 import logger
-from definitions import CONFIG_PATH
-
-config = yaml.safe_load(open(CONFIG_PATH, encoding="utf8"))
+import metrics
+from settings import config
+from definitions import RADARR_LIBRARY_PATH
 
 # Set up logging
 logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
 logger = logger.getLogger("addarr.radarr", logLevel, config.get("logToConsole", False))
 
-config = config["radarr"]
+config = config.section("radarr")
+
+client = commons.ApiClient("radarr")
+metadataCache = cache.TTLCache(config.get("cacheTTL", 3600))
+searchCache = cache.TTLCache(
+    config.get("searchCacheTTL", 900), maxsize=config.get("searchCacheSize", 256)
+)
+metrics.registerCache("radarr_metadata", metadataCache)
+metrics.registerCache("radarr_search", searchCache)
+searchCalls = cache.Coalescer()
+# What addToLibrary needs of the search results the user picks from, so
+# adding doesn't have to look the title up again
+addDataCache = cache.TTLCache(
+    config.get("addDataCacheTTL", 3600), maxsize=config.get("addDataCacheSize", 1024)
+)
+metrics.registerCache("radarr_add_data", addDataCache)
 
 addMovieNeededFields = ["tmdbId", "year", "title", "titleSlug", "images"]
+libraryMovieFields = ["tmdbId", "id", "title", "year", "monitored", "status"]
 
 
 def search(title):
+    key = commons.normalizeTitle(title)
+    parsed_json = searchCache.get(key)
+    if parsed_json is not None:
+        logger.debug(f"Search cache hit for [{key}]: {searchCache.stats()}")
+        return parsed_json
+
+    # Callers searching the same title at the same time share one lookup
+    return searchCalls.run(key, lambda: lookup(title, key))
+
+
+def lookup(title, key):
     parameters = {"term": title}
-    req = requests.get(commons.generateApiQuery("radarr", "movie/lookup", parameters))
+    req = client.get("movie/lookup", parameters)
     parsed_json = json.loads(req.text)
 
     if req.status_code == 200 and parsed_json:
+        searchCache.set(key, parsed_json)
         return parsed_json
     else:
         return False
@@ -37,6 +65,10 @@ def giveTitles(parsed_json):
         if all(
             x in movie for x in ["title", "overview", "remotePoster", "year", "tmdbId"]
         ):
+            if all(key in movie for key in addMovieNeededFields):
+                addDataCache.set(
+                    movie["tmdbId"], {key: movie[key] for key in addMovieNeededFields}
+                )
             data.append(
                 {
                     "title": movie["title"],
@@ -49,22 +81,39 @@ def giveTitles(parsed_json):
     return data
 
 
+def fetchMovies():
+    with client.get("movie", stream=True) as req:
+        req.raise_for_status()
+        # Stream the library so only the projected fields are kept per movie
+        for movie in commons.iterJsonArray(req):
+            if all(x in movie for x in libraryMovieFields):
+                yield movie
+
+
+librarySnapshot = library.LibrarySnapshot(
+    "radarr",
+    fetchMovies,
+    "tmdbId",
+    libraryMovieFields,
+    RADARR_LIBRARY_PATH,
+    config.get("libraryRefresh", 900),
+)
+
+
 def inLibrary(tmdbId):
-    parameters = {}
-    req = requests.get(commons.generateApiQuery("radarr", "movie", parameters))
-    parsed_json = json.loads(req.text)
-    return next((True for movie in parsed_json if movie["tmdbId"] == tmdbId), False)
+    return librarySnapshot.contains(tmdbId)
 
 
 def addToLibrary(tmdbId, path, profile):
-    parameters = {"tmdbId": str(tmdbId)}
-    req = requests.get(
-        commons.generateApiQuery("radarr", "movie/lookup/tmdb", parameters)
-    )
-    parsed_json = json.loads(req.text)
+    parsed_json = addDataCache.get(tmdbId)
+    if parsed_json is None:
+        parameters = {"tmdbId": str(tmdbId)}
+        req = client.get("movie/lookup/tmdb", parameters)
+        parsed_json = json.loads(req.text)
     data = json.dumps(buildData(parsed_json, path, profile))
-    add = requests.post(commons.generateApiQuery("radarr", "movie"), data=data)
+    add = client.post("movie", data=data)
     if add.status_code == 201:
+        librarySnapshot.put(add.json())
         return True
     else:
         return False
@@ -82,22 +131,38 @@ def buildData(json, path, profile):
     return built_data
 
 
-def getRootFolders():
-    req = requests.get(commons.generateApiQuery("radarr", "Rootfolder"))
+def fetchRootFolders():
+    req = client.get("Rootfolder")
+    req.raise_for_status()
     parsed_json = json.loads(req.text)
     logger.debug(f"Found Radarr paths: {parsed_json}")
     return parsed_json
 
 
-def getProfiles():
-    req = requests.get(commons.generateApiQuery("radarr", "qualityProfile"))
+def fetchProfiles():
+    req = client.get("qualityProfile")
+    req.raise_for_status()
     parsed_json = json.loads(req.text)
     logger.debug(f"Found Radarr Profiles: {parsed_json}")
     return parsed_json
 
 
+def getRootFolders():
+    return metadataCache.getOrLoad("rootFolders", fetchRootFolders)
+
+
+def getProfiles():
+    return metadataCache.getOrLoad("profiles", fetchProfiles)
+
+
+def invalidateCache():
+    metadataCache.invalidate()
+    searchCache.invalidate()
+    addDataCache.invalidate()
+
+
 def get_queue_pourcentage():
-    req = requests.get(commons.generateApiQuery("radarr", "queue"))
+    req = client.get("queue")
     parsed_json = json.loads(req.text)
     logger.debug(f"Found Radarr Queue")
 
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import signal
+import threading
+import time
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import NamedTuple
+
+import yaml
+
+import logger
+from definitions import CONFIG_PATH, LANG_PATH
+
+# Keys every config.yaml needs, with their expected type
+REQUIRED = {
+    ("telegram", "token"): str,
+    ("telegram", "password"): (str, int),
+    ("language",): str,
+    ("entrypointAuth",): str,
+    ("entrypointAdd",): str,
+    ("entrypointAllSeries",): str,
+    ("entrypointTransmission",): str,
+    ("entrypointPourcentage",): str,
+    ("season",): str,
+    ("sonarr", "server", "addr"): str,
+    ("sonarr", "server", "port"): (int, str),
+    ("sonarr", "server", "path"): str,
+    ("sonarr", "server", "ssl"): bool,
+    ("sonarr", "auth", "apikey"): str,
+    ("radarr", "server", "addr"): str,
+    ("radarr", "server", "port"): (int, str),
+    ("radarr", "server", "path"): str,
+    ("radarr", "server", "ssl"): bool,
+    ("radarr", "auth", "apikey"): str,
+    ("transmission", "enable"): bool,
+}
+
+
+class Settings(NamedTuple):
+    config: Mapping
+    transcript: Mapping
+    mtimes: tuple
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def validate(config):
+    if not isinstance(config, dict):
+        raise ValueError(f"{CONFIG_PATH} doesn't contain a mapping")
+    errors = []
+    for path, expected in REQUIRED.items():
+        value = config
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        if value is None:
+            errors.append(f"{'.'.join(path)} is missing")
+        elif not isinstance(value, expected):
+            errors.append(f"{'.'.join(path)} has the wrong type")
+    if errors:
+        raise ValueError(f"Invalid {CONFIG_PATH}: " + ", ".join(errors))
+
+
+def loadTranscript(language):
+    # Only construct the selected language, the others are just parsed
+    with open(LANG_PATH, encoding="utf8") as file:
+        loader = yaml.SafeLoader(file)
+        try:
+            root = loader.get_single_node()
+            for keyNode, valueNode in root.value:
+                if keyNode.value == language:
+                    return loader.construct_document(valueNode)
+        finally:
+            loader.dispose()
+    raise ValueError(f"Language {language} isn't defined in {LANG_PATH}")
+
+
+def mtimes():
+    return (os.stat(CONFIG_PATH).st_mtime_ns,)
+
+
+def load(transcript=None):
+    stamp = mtimes()
+    with open(CONFIG_PATH, encoding="utf8") as file:
+        config = yaml.safe_load(file)
+    validate(config)
+    if transcript is None:
+        transcript = freeze(loadTranscript(config["language"]))
+    return Settings(freeze(config), transcript, stamp)
+
+
+current = load()
+
+# Set up logging
+logLevel = logging.DEBUG if current.config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger(
+    "addarr.settings", logLevel, current.config.get("logToConsole", False)
+)
+
+
+def reload():
+    """Parse the config again and swap it in when it's valid.
+
+    The transcript stays as it was loaded at startup: the handlers match
+    the labels of their keyboards, so a new language needs a restart.
+    """
+    global current
+    try:
+        current = load(current.transcript)
+    except Exception as e:
+        logger.error(f"Keeping the current config, reload failed: {e}")
+        return False
+    logger.info("Config reloaded")
+    return True
+
+
+def watch(interval=10):
+    """Reload on SIGHUP and whenever config.yaml changes."""
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda signum, frame: reload())
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                changed = mtimes() != current.mtimes
+            except OSError:
+                changed = False
+            if changed:
+                reload()
+
+    threading.Thread(target=run, name="settings-watch", daemon=True).start()
+
+
+class View(Mapping):
+    """Read-only view on a part of the current settings.
+
+    Every lookup goes through the settings that are current at that moment,
+    so modules can keep a View at module level and still see reloads.
+    """
+
+    def __init__(self, part, path=()):
+        self.part = part
+        self.path = path
+
+    def resolve(self):
+        value = getattr(current, self.part)
+        for key in self.path:
+            value = value[key]
+        return value
+
+    def section(self, key):
+        return View(self.part, self.path + (key,))
+
+    def __getitem__(self, key):
+        return self.resolve()[key]
+
+    def __iter__(self):
+        return iter(self.resolve())
+
+    def __len__(self):
+        return len(self.resolve())
+
+
+config = View("config")
+transcript = View("transcript")
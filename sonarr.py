@@ -1,31 +1,60 @@
 #!/usr/bin/env python3
 
+import cache
 import commons as commons
 import json
+import library
 import logging
-import requests
-import yaml
+import titleindex
 
 import logger
-from definitions import CONFIG_PATH
-
-config = yaml.safe_load(open(CONFIG_PATH, encoding="utf8"))
+import metrics
+from settings import config
+from definitions import SONARR_LIBRARY_PATH
 
 # Set up logging
 logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
 logger = logger.getLogger("addarr.sonarr", logLevel, config.get("logToConsole", False))
 
-config = config["sonarr"]
+config = config.section("sonarr")
+
+client = commons.ApiClient("sonarr")
+metadataCache = cache.TTLCache(config.get("cacheTTL", 3600))
+searchCache = cache.TTLCache(
+    config.get("searchCacheTTL", 900), maxsize=config.get("searchCacheSize", 256)
+)
+metrics.registerCache("sonarr_metadata", metadataCache)
+metrics.registerCache("sonarr_search", searchCache)
+searchCalls = cache.Coalescer()
+# What addToLibrary needs of the search results the user picks from, so
+# adding doesn't have to look the title up again
+addDataCache = cache.TTLCache(
+    config.get("addDataCacheTTL", 3600), maxsize=config.get("addDataCacheSize", 1024)
+)
+metrics.registerCache("sonarr_add_data", addDataCache)
 
 addSerieNeededFields = ["tvdbId", "tvRageId", "title", "titleSlug", "images", "seasons"]
+librarySeriesFields = ["tvdbId", "id", "title", "year", "monitored", "status", "seasonCount"]
 
 
 def search(title):
+    key = commons.normalizeTitle(title)
+    parsed_json = searchCache.get(key)
+    if parsed_json is not None:
+        logger.debug(f"Search cache hit for [{key}]: {searchCache.stats()}")
+        return parsed_json
+
+    # Callers searching the same title at the same time share one lookup
+    return searchCalls.run(key, lambda: lookup(title, key))
+
+
+def lookup(title, key):
     parameters = {"term": title}
-    req = requests.get(commons.generateApiQuery("sonarr", "series/lookup", parameters))
+    req = client.get("series/lookup", parameters)
     parsed_json = json.loads(req.text)
 
     if req.status_code == 200 and parsed_json:
+        searchCache.set(key, parsed_json)
         return parsed_json
     else:
         return False
@@ -38,6 +67,10 @@ def giveTitles(parsed_json):
             x in show
             for x in ["title", "seasonCount", "remotePoster", "year", "tvdbId"]
         ):
+            addDataCache.set(
+                show["tvdbId"],
+                [{key: show[key] for key in addSerieNeededFields if key in show}],
+            )
             data.append(
                 {
                     "title": show["title"],
@@ -51,20 +84,21 @@ def giveTitles(parsed_json):
             )
     return data
 
+
 def inLibrary(tvdbId):
-    parameters = {}
-    req = requests.get(commons.generateApiQuery("sonarr", "series", parameters))
-    parsed_json = json.loads(req.text)
-    return next((True for show in parsed_json if show["tvdbId"] == tvdbId), False)
+    return librarySnapshot.contains(tvdbId)
 
 
 def addToLibrary(tvdbId, path, profile):
-    parameters = {"term": "tvdb:" + str(tvdbId)}
-    req = requests.get(commons.generateApiQuery("sonarr", "series/lookup", parameters))
-    parsed_json = json.loads(req.text)
+    parsed_json = addDataCache.get(tvdbId)
+    if parsed_json is None:
+        parameters = {"term": "tvdb:" + str(tvdbId)}
+        req = client.get("series/lookup", parameters)
+        parsed_json = json.loads(req.text)
     data = json.dumps(buildData(parsed_json, path, profile))
-    add = requests.post(commons.generateApiQuery("sonarr", "series"), data=data)
+    add = client.post("series", data=data)
     if add.status_code == 201:
+        librarySnapshot.put(add.json())
         return True
     else:
         return False
@@ -89,9 +123,10 @@ def buildData(json, path, profile):
     return built_data
 
 
-def getRootFolders():
+def fetchRootFolders():
     parameters = {}
-    req = requests.get(commons.generateApiQuery("sonarr", "Rootfolder", parameters))
+    req = client.get("Rootfolder", parameters)
+    req.raise_for_status()
     parsed_json = json.loads(req.text)
     # Remove unmappedFolders from rootFolder data--we don't need that
     for item in [
@@ -101,46 +136,72 @@ def getRootFolders():
     logger.debug(f"Found sonarr paths: {parsed_json}")
     return parsed_json
 
-def getProfiles():
-    req = requests.get(commons.generateApiQuery("sonarr", "profile"))
+def fetchProfiles():
+    req = client.get("profile")
+    req.raise_for_status()
     parsed_json = json.loads(req.text)
     return parsed_json
 
-def allSeries():
+
+def getRootFolders():
+    return metadataCache.getOrLoad("rootFolders", fetchRootFolders)
+
+
+def getProfiles():
+    return metadataCache.getOrLoad("profiles", fetchProfiles)
+
+
+def invalidateCache():
+    metadataCache.invalidate()
+    searchCache.invalidate()
+    addDataCache.invalidate()
+
+
+def fetchSeries():
     parameters = {}
-    req = requests.get(commons.generateApiQuery("sonarr", "series", parameters))
-    parsed_json = json.loads(req.text)
+    with client.get("series", parameters, stream=True) as req:
+        req.raise_for_status()
+        # Stream the library so only the projected fields are kept per series
+        for show in commons.iterJsonArray(req):
+            if all(x in show for x in librarySeriesFields):
+                yield show
 
-    if req.status_code == 200:
-        data = []
-        for show in parsed_json:
-            if all(
-                x in show
-                for x in ["title", "year", "monitored", "status", "id", "seasonCount"]
-            ):
-                data.append(
-                    {
-                        "title": show["title"],
-                        "year": show["year"],
-                        "monitored": show["monitored"],
-                        "status": show["status"],
-                        "id": show["id"],
-                        "seasonCount": show["seasonCount"]
-                    }
-                )
-        return data
-    else:
-        return False
+
+librarySnapshot = library.LibrarySnapshot(
+    "sonarr",
+    fetchSeries,
+    "tvdbId",
+    librarySeriesFields,
+    SONARR_LIBRARY_PATH,
+    config.get("libraryRefresh", 900),
+)
+
+
+def allSeries():
+    return librarySnapshot.all()
+
+
+seriesIndex = None
+
+
+def titleIndex():
+    """Trigram index over the titles of the library, rebuilt when it changed."""
+    global seriesIndex
+    version, series = librarySnapshot.view()
+    index = seriesIndex
+    if index is None or index.version != version:
+        index = seriesIndex = titleindex.TitleIndex(series, version)
+    return index
 
 
 def searchSeason(seriesId, seasonNumber):
     data = {"name": "SeasonSearch", "seriesId": seriesId, "seasonNumber": seasonNumber}
-    req = requests.post(commons.generateApiQuery("sonarr", "command"), json=data)
+    req = client.post("command", json=data)
     return req.status_code == 201
 
 
 def get_queue_pourcentage():
-    req = requests.get(commons.generateApiQuery("sonarr", "queue"))
+    req = client.get("queue")
     parsed_json = json.loads(req.text)
     logger.debug(f"Found sonarr Queue")
 
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+from contextlib import contextmanager
+
+# Run with --profile-startup to print how long every startup phase takes
+enabled = "--profile-startup" in sys.argv
+started = time.perf_counter()
+timings = []
+
+
+@contextmanager
+def phase(name):
+    begin = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.append((name, time.perf_counter() - begin))
+
+
+def report():
+    lines = [f"{name:<36}{seconds * 1000:10.1f} ms" for name, seconds in timings]
+    lines.append(f"{'total':<36}{(time.perf_counter() - started) * 1000:10.1f} ms")
+    return "\n".join(lines)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import logger
+from settings import config
+from definitions import REQUESTS_PATH, REQUESTS_DB_PATH
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.store", logLevel, config.get("logToConsole", False))
+
+
+class Database:
+    """SQLite database in WAL mode with one connection per thread."""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+
+class RequestStore:
+    """Chat that requested each movie or series, keyed by its TMDB/TVDB ID."""
+
+    def __init__(self, database):
+        self.database = database
+        with self.database.connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS requests"
+                " (media_id TEXT PRIMARY KEY, chat_id INTEGER NOT NULL)"
+            )
+
+    def add(self, mediaId, chatId):
+        with self.database.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO requests (media_id, chat_id) VALUES (?, ?)",
+                (str(mediaId), chatId),
+            )
+
+    def get(self, mediaId):
+        row = self.database.connection().execute(
+            "SELECT chat_id FROM requests WHERE media_id = ?", (str(mediaId),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def migrate(self, jsonPath):
+        # One-time import of the user_requests.json used by older versions
+        if not os.path.exists(jsonPath):
+            return
+        with open(jsonPath, "r") as json_file:
+            try:
+                requests_json = json.load(json_file)
+            except ValueError:
+                requests_json = {}
+        with self.database.connection() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO requests (media_id, chat_id) VALUES (?, ?)",
+                [(str(k), v) for k, v in requests_json.items()],
+            )
+        os.replace(jsonPath, jsonPath + ".migrated")
+        logger.info(f"Migrated {len(requests_json)} requests from {jsonPath}")
+
+
+class NotificationQueue:
+    """Durable queue of chat notifications waiting to be delivered.
+
+    Every notification is keyed by the webhook event it came from, so a
+    webhook that Sonarr/Radarr retries is only queued once.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        with self.database.connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS notifications"
+                " (event_key TEXT PRIMARY KEY, chat_id INTEGER NOT NULL,"
+                " text TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,"
+                " next_attempt REAL NOT NULL, status TEXT NOT NULL DEFAULT 'pending',"
+                " created REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS notifications_due"
+                " ON notifications (status, next_attempt)"
+            )
+
+    def enqueue(self, eventKey, chatId, text):
+        now = time.time()
+        with self.database.connection() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO notifications"
+                " (event_key, chat_id, text, next_attempt, created)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (eventKey, chatId, text, now, now),
+            )
+        return cursor.rowcount == 1
+
+    def due(self, limit=50):
+        return self.database.connection().execute(
+            "SELECT event_key, chat_id, text, attempts FROM notifications"
+            " WHERE status = 'pending' AND next_attempt <= ?"
+            " ORDER BY next_attempt LIMIT ?",
+            (time.time(), limit),
+        ).fetchall()
+
+    def markDelivered(self, eventKey):
+        with self.database.connection() as conn:
+            conn.execute(
+                "UPDATE notifications SET status = 'delivered' WHERE event_key = ?",
+                (eventKey,),
+            )
+
+    def markFailed(self, eventKey):
+        with self.database.connection() as conn:
+            conn.execute(
+                "UPDATE notifications SET status = 'failed' WHERE event_key = ?",
+                (eventKey,),
+            )
+
+    def retryLater(self, eventKey, delay):
+        with self.database.connection() as conn:
+            conn.execute(
+                "UPDATE notifications SET attempts = attempts + 1, next_attempt = ?"
+                " WHERE event_key = ?",
+                (time.time() + delay, eventKey),
+            )
+
+    def purge(self, olderThan):
+        # Finished notifications are only kept to recognize retried webhooks
+        with self.database.connection() as conn:
+            conn.execute(
+                "DELETE FROM notifications WHERE status != 'pending' AND created < ?",
+                (time.time() - olderThan,),
+            )
+
+
+class PosterCache:
+    """Telegram file_id of every poster URL already sent, most recent first.
+
+    Only the `maxsize` most recently used posters are kept.
+    """
+
+    def __init__(self, database, maxsize):
+        self.database = database
+        self.maxsize = maxsize
+        with self.database.connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS posters"
+                " (url TEXT PRIMARY KEY, file_id TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS posters_last_used ON posters (last_used)"
+            )
+
+    def get(self, url):
+        with self.database.connection() as conn:
+            row = conn.execute(
+                "SELECT file_id FROM posters WHERE url = ?", (url,)
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE posters SET last_used = ? WHERE url = ?", (time.time(), url)
+                )
+        return row[0] if row else None
+
+    def put(self, url, fileId):
+        with self.database.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO posters (url, file_id, last_used) VALUES (?, ?, ?)",
+                (url, fileId, time.time()),
+            )
+            conn.execute(
+                "DELETE FROM posters WHERE url IN (SELECT url FROM posters"
+                " ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            )
+
+    def remove(self, url):
+        with self.database.connection() as conn:
+            conn.execute("DELETE FROM posters WHERE url = ?", (url,))
+
+
+database = Database(REQUESTS_DB_PATH)
+# Set by init(), importing this module doesn't touch the disk
+userRequests = None
+notifications = None
+posters = None
+
+
+def init():
+    """Create the tables and import the requests of older versions."""
+    global userRequests, notifications, posters
+    userRequests = RequestStore(database)
+    userRequests.migrate(REQUESTS_PATH)
+    notifications = NotificationQueue(database)
+    posters = PosterCache(database, config.get("posterCacheSize", 2000))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import heapq
+from collections import Counter, defaultdict
+from itertools import islice
+
+import commons
+
+# Titles that are scored per search at most
+MAX_CANDIDATES = 64
+# Posting lists intersected per search, the rarest ones. The trigrams of
+# the others are checked on the candidates, shortest title first
+MAX_INTERSECTED = 3
+# Postings a misspelled query counts hits in at most, the rarest first
+MAX_SCANNED = 8192
+
+
+def trigrams(title):
+    # Padded, so the start of a title counts more than the middle of it
+    padded = f"  {title} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleIndex:
+    """Fuzzy title search over a fixed list of items, by shared trigrams.
+
+    `version` is the version of the library snapshot the items come from,
+    so callers can tell when the index has to be built again.
+    """
+
+    def __init__(self, items, version=None, key=lambda item: item["title"]):
+        self.version = version
+        titles = [commons.normalizeTitle(str(key(item))) for item in items]
+        # Positions go from the shortest title to the longest, so the
+        # shortest candidates are the lowest positions
+        order = sorted(range(len(items)), key=lambda position: len(titles[position]))
+        self.items = [items[position] for position in order]
+        self.padded = []
+        self.gramCounts = []
+        self.byTitle = {}
+        postings = defaultdict(list)
+        for position, (title, item) in enumerate(
+            zip((titles[position] for position in order), self.items)
+        ):
+            grams = trigrams(title)
+            self.padded.append(f"  {title} ")
+            self.gramCounts.append(len(grams))
+            self.byTitle.setdefault(title, item)
+            for gram in grams:
+                postings[gram].append(position)
+        self.postings = dict(postings)
+
+    def get(self, title):
+        """The item with exactly this title, ignoring case and whitespace."""
+        return self.byTitle.get(commons.normalizeTitle(title))
+
+    def search(self, query, limit=8):
+        query = commons.normalizeTitle(query)
+        if not query:
+            return []
+        grams = trigrams(query)
+        # The gram of the first letter only matches titles that start the
+        # same, score() still counts it
+        postings = sorted(
+            (
+                (self.postings[gram], gram)
+                for gram in grams
+                if gram in self.postings and not gram.startswith("  ")
+            ),
+            key=lambda entry: len(entry[0]),
+        )
+        if not postings:
+            return []
+        # Titles with every trigram of the query: the rarest posting lists
+        # are intersected, the shortest titles left are checked for the
+        # common trigrams
+        candidates = set(postings[0][0])
+        for positions, _ in postings[1:MAX_INTERSECTED]:
+            candidates.intersection_update(positions)
+        common = [gram for _, gram in postings[MAX_INTERSECTED:]]
+        if common or len(candidates) > MAX_CANDIDATES:
+            candidates = list(
+                islice(
+                    (
+                        position
+                        for position in sorted(candidates)
+                        if all(gram in self.padded[position] for gram in common)
+                    ),
+                    MAX_CANDIDATES,
+                )
+            )
+        if not candidates:
+            # A misspelled query: the titles sharing the most of its rarer
+            # trigrams
+            hits = Counter()
+            scanned = 0
+            for positions, _ in postings:
+                scanned += len(positions)
+                if hits and scanned > MAX_SCANNED:
+                    break
+                hits.update(positions)
+            candidates = [position for position, _ in hits.most_common(MAX_CANDIDATES)]
+
+        def score(position):
+            padded = self.padded[position]
+            shared = sum(1 for gram in grams if gram in padded)
+            # Titles that contain the query first, then by Jaccard similarity of
+            # the trigram sets, then the shorter title
+            similarity = shared / (len(grams) + self.gramCounts[position] - shared)
+            return (query in padded, similarity, -len(padded))
+
+        best = heapq.nlargest(limit, candidates, key=score)
+        return [self.items[position] for position in best]
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import logging
+import threading
+import requests
+
+import logger
+from settings import config
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger(
+    "addarr.transmission", logLevel, config.get("logToConsole", False)
+)
+
+config = config.section("transmission")
+
+SESSION_HEADER = "X-Transmission-Session-Id"
+
+
+class TransmissionError(Exception):
+    pass
+
+
+class RpcClient:
+    """Transmission RPC over one keep-alive session.
+
+    The CSRF token Transmission hands out is kept and only fetched again
+    when the daemon answers 409, e.g. after it restarted.
+    """
+
+    def __init__(self):
+        self.session = requests.Session()
+        self.sessionId = None
+        self.lock = threading.Lock()
+
+    def url(self):
+        host = config["host"]
+        if ":" not in host:
+            host += ":9091"
+        scheme = "https" if config.get("ssl", False) else "http"
+        return f"{scheme}://{host}{config.get('rpcPath', '/transmission/rpc')}"
+
+    def call(self, method, arguments={}):
+        auth = None
+        if config["authentication"]:
+            auth = (config["username"], config["password"])
+        payload = {"method": method, "arguments": arguments}
+        for _ in range(2):
+            with self.lock:
+                sessionId = self.sessionId
+            headers = {SESSION_HEADER: sessionId} if sessionId else {}
+            response = self.session.post(
+                self.url(), json=payload, headers=headers, auth=auth, timeout=(5, 30)
+            )
+            if response.status_code != 409:
+                break
+            with self.lock:
+                self.sessionId = response.headers.get(SESSION_HEADER)
+        response.raise_for_status()
+        result = response.json()
+        if result.get("result") != "success":
+            raise TransmissionError(result.get("result", "no result"))
+        return result.get("arguments", {})
+
+
+client = RpcClient()
+
+
+def setAltSpeed(enabled):
+    """Turn the Temporary Speed Limits on or off, True when it worked."""
+    try:
+        client.call("session-set", {"alt-speed-enabled": enabled})
+    except (requests.RequestException, ValueError, TransmissionError) as e:
+        logger.error(f"Changing the Transmission speed failed: {e}")
+        return False
+    return True
+
+
+def getStatus():
+    """Current (download, upload) speed in bytes/s and whether the
+    Temporary Speed Limits are on, or None when Transmission can't be
+    reached."""
+    try:
+        stats = client.call("session-stats")
+        altSpeed = client.call("session-get", {"fields": ["alt-speed-enabled"]})
+        return (
+            stats["downloadSpeed"],
+            stats["uploadSpeed"],
+            altSpeed["alt-speed-enabled"],
+        )
+    except (requests.RequestException, ValueError, KeyError, TransmissionError) as e:
+        logger.error(f"Getting the Transmission status failed: {e}")
+        return None
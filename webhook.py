@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+import hmac
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, abort, request
+from telegram import Update
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+import logger
+import metrics
+import notifier
+from settings import config
+
+# Set up logging
+logLevel = logging.DEBUG if config.get("debugLogging", False) else logging.INFO
+logger = logger.getLogger("addarr.webhook", logLevel, config.get("logToConsole", False))
+
+# Server settings, only read at startup
+settings = config.get("webhook", {})
+host = settings.get("host", "0.0.0.0")
+port = settings.get("port", 6200)
+threads = settings.get("threads", 8)
+backlog = settings.get("backlog", 64)
+keepAliveTimeout = settings.get("keepAliveTimeout", 5)
+
+APP = Flask(__name__)
+# Larger bodies are answered with 413 before they're read
+APP.config["MAX_CONTENT_LENGTH"] = settings.get("maxBodySize", 1024 * 1024)
+
+# Event types Sonarr/Radarr send, anything else is counted as "other"
+EVENT_TYPES = {
+    "Test", "Grab", "Download", "Rename", "SeriesDelete", "EpisodeFileDelete",
+    "MovieDelete", "MovieFileDelete", "MovieAdded", "SeriesAdd", "Health",
+    "HealthRestored", "ApplicationUpdate", "ManualInteractionRequired",
+}
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Idle keep-alive connections are closed after this many seconds
+    timeout = keepAliveTimeout
+
+    def log_request(self, code="-", size="-"):
+        logger.debug(f'"{self.requestline}" {code} {size}')
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """WSGI server that handles connections on a fixed pool of threads.
+
+    While every thread is busy no new connection is accepted, so a burst
+    waits in the listen backlog instead of starting a thread per request.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads, backlog):
+        self.request_queue_size = backlog
+        super().__init__(host, port, app, handler=QuietRequestHandler)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="webhook")
+        self.slots = threading.BoundedSemaphore(threads)
+
+    def process_request(self, request, client_address):
+        self.slots.acquire()
+        self.pool.submit(self.processInWorker, request, client_address)
+
+    def processInWorker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+
+def serveWaitress(waitress):
+    waitress.serve(
+        APP,
+        host=host,
+        port=port,
+        threads=threads,
+        backlog=backlog,
+        channel_timeout=keepAliveTimeout,
+        max_request_body_size=APP.config["MAX_CONTENT_LENGTH"],
+        ident="Addarr",
+    )
+
+
+def serveWerkzeug():
+    PooledWSGIServer(host, port, APP, threads, backlog).serve_forever()
+
+
+def flask_start():
+    if settings.get("server", "werkzeug") == "waitress":
+        try:
+            import waitress
+        except ImportError:
+            logger.warning("waitress isn't installed, using the built-in server")
+        else:
+            return serveWaitress(waitress)
+    serveWerkzeug()
+
+
+# Telegram sends the secret token of set_webhook back in this header
+TELEGRAM_SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+notificationsEnabled = True
+
+
+@APP.route('/', methods=['GET', 'POST'])
+def notify_chat():
+    if not notificationsEnabled:
+        abort(404)
+    # Only queue the notification here, so Sonarr/Radarr get their answer
+    # without waiting for Telegram
+    data = request.get_json(silent=True)
+    eventType = data.get("eventType") if isinstance(data, dict) else None
+    if eventType not in EVENT_TYPES:
+        eventType = "other"
+    metrics.webhookEvents.inc(eventType)
+    if not notifier.enqueue(data):
+        return "Not OK"
+    return "Accepted", 202
+
+
+@APP.route('/metrics')
+def metrics_page():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def attachTelegram(updater, path, secretToken):
+    """Feed the updates Telegram posts to `path` into the dispatcher.
+
+    Call before start(), Flask doesn't accept new routes once it served
+    a request.
+    """
+
+    def telegram_update():
+        token = request.headers.get(TELEGRAM_SECRET_HEADER, "")
+        if not hmac.compare_digest(token, secretToken):
+            return "Forbidden", 403
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return "Bad Request", 400
+        updater.update_queue.put(Update.de_json(data, updater.bot))
+        return "OK"
+
+    APP.add_url_rule(path, "telegram_update", telegram_update, methods=["POST"])
+
+
+def start(notifications=True):
+    global notificationsEnabled
+    notificationsEnabled = notifications
+    if notifications:
+        notifier.start()
+    flask_thread = threading.Thread(target=flask_start, name="webhook", daemon=True)
+    flask_thread.start()
+    return flask_thread